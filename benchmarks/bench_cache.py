@@ -0,0 +1,99 @@
+"""HTTP缓存存储后端基准：FilesystemCacheStorage与SqliteCacheStorage的写入、查找耗时和磁盘占用对比
+
+用法:
+    python benchmarks/bench_cache.py
+    python benchmarks/bench_cache.py --copies 10 --lookups 20000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from types import SimpleNamespace
+
+from corpus import iter_cached_responses
+
+from scrapy.extensions.httpcache import FilesystemCacheStorage
+from scrapy.http import Request
+from scrapy.settings import Settings
+from scrapy.utils.request import RequestFingerprinter
+
+from ngamonitor.httpcache import SqliteCacheStorage
+
+
+def disk_usage(path):
+    """返回(字节数, 文件数, 目录数)，字节数按块大小向上取整，反映实际占用"""
+    size = files = dirs = 0
+    for root, dirnames, filenames in os.walk(path):
+        dirs += len(dirnames)
+        for name in filenames:
+            st = os.stat(os.path.join(root, name))
+            size += getattr(st, 'st_blocks', 0) * 512 or st.st_size
+            files += 1
+    return size, files, dirs
+
+
+def load_entries(copies):
+    """缓存语料重复copies份，每份改写tid使请求指纹不同，模拟更大的缓存"""
+    entries = []
+    for response in iter_cached_responses(status=None):
+        for copy in range(copies):
+            url = f'{response.url}&copy={copy}' if copy else response.url
+            entries.append((Request(url), response.replace(url=url)))
+    return entries
+
+
+def bench_storage(name, storage_cls, settings, entries, lookups, spider):
+    storage = storage_cls(settings)
+    storage.open_spider(spider)
+
+    start = time.perf_counter()
+    for request, response in entries:
+        storage.store_response(spider, request, response)
+    store_seconds = time.perf_counter() - start
+
+    rng = random.Random(0)
+    hits = [rng.choice(entries)[0] for _ in range(lookups)]
+    misses = [Request(f'https://bbs.nga.cn/read.php?tid=miss{i}') for i in range(lookups // 10)]
+    latencies = []
+    for request in hits + misses:
+        start = time.perf_counter()
+        storage.retrieve_response(spider, request)
+        latencies.append(time.perf_counter() - start)
+    storage.close_spider(spider)
+
+    latencies.sort()
+    size, files, dirs = disk_usage(settings['HTTPCACHE_DIR'])
+    p50 = latencies[len(latencies) // 2] * 1e6
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+    print(f'{name:<12}{store_seconds / len(entries) * 1e6:>12.0f}{p50:>12.0f}{p99:>12.0f}'
+          f'{size / 1024 / 1024:>12.1f}{files:>10}{dirs:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--copies', type=int, default=4, help='语料重复份数')
+    parser.add_argument('--lookups', type=int, default=5000)
+    args = parser.parse_args()
+
+    entries = load_entries(args.copies)
+    spider = SimpleNamespace(name='nga_monitor', crawler=SimpleNamespace(request_fingerprinter=RequestFingerprinter()))
+    print(f'缓存条目 {len(entries)} 个，查找 {args.lookups} 次命中 + {args.lookups // 10} 次未命中')
+    print(f"{'后端':<12}{'写入(us)':>12}{'查找p50(us)':>12}{'查找p99(us)':>12}{'磁盘(MB)':>12}{'文件数':>10}{'目录数':>10}")
+    backends = [
+        ('filesystem', FilesystemCacheStorage, {}),
+        ('fs+gzip', FilesystemCacheStorage, {'HTTPCACHE_GZIP': True}),
+        ('sqlite', SqliteCacheStorage, {}),
+    ]
+    for name, storage_cls, extra in backends:
+        workdir = tempfile.mkdtemp(prefix='nga_cache_')
+        try:
+            settings = Settings({'HTTPCACHE_DIR': workdir, 'HTTPCACHE_EXPIRATION_SECS': 0, **extra})
+            bench_storage(name, storage_cls, settings, entries, args.lookups, spider)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""风险关键词匹配基准：逐词小写比较的旧实现与Aho-Corasick一次扫描的对比
+
+用法:
+    python benchmarks/bench_keywords.py --keywords 9 1000 5000
+"""
+import argparse
+import random
+import time
+
+from corpus import iter_cached_responses
+
+from ngamonitor.keywords import KeywordMatcher
+from ngamonitor.pipelines import NgaMonitorPipeline
+
+
+def legacy_match(content, keywords):
+    # 与旧版NgaMonitorPipeline相同：每个关键词都重新对全文小写后查找
+    return [keyword for keyword in keywords if keyword.lower() in content.lower()]
+
+
+def make_keywords(count, texts, seed=0):
+    """默认关键词加上从语料中随机截取的词，保证有一定命中率"""
+    rng = random.Random(seed)
+    keywords = list(NgaMonitorPipeline.RISK_KEYWORDS)
+    while len(keywords) < count:
+        text = rng.choice(texts)
+        start = rng.randrange(max(len(text) - 4, 1))
+        keywords.append(text[start:start + rng.randint(2, 4)])
+    return keywords[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keywords', type=int, nargs='+', default=[9, 1000, 5000])
+    args = parser.parse_args()
+
+    texts = [''.join(r.css('#postcontent0 ::text').getall()) for r in iter_cached_responses('/read.php')]
+    texts = [t for t in texts if t.strip()]
+    size = sum(len(t) for t in texts)
+    print(f'{len(texts)} 篇正文，共 {size} 字')
+    print(f"{'关键词数':>8}{'构建(ms)':>12}{'旧实现(ms)':>14}{'AC(ms)':>12}")
+    for count in args.keywords:
+        keywords = make_keywords(count, texts)
+        start = time.perf_counter()
+        matcher = KeywordMatcher(keywords)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        legacy = [legacy_match(t, keywords) for t in texts]
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast = [matcher.scan(t) for t in texts]
+        fast_seconds = time.perf_counter() - start
+
+        assert [sorted(set(h)) for h in legacy] == [sorted(h) for h in fast]
+        print(f'{count:>8}{build * 1000:>12.1f}{legacy_seconds * 1000:>14.1f}{fast_seconds * 1000:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
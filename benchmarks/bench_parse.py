@@ -0,0 +1,141 @@
+"""read.php解析基准：旧版CSS提取、单次遍历提取和JSON解析的吞吐对比
+
+用法:
+    python benchmarks/bench_parse.py [--repeat N] [--floors 200]
+    python benchmarks/bench_parse.py --check    # 新旧HTML提取结果逐页比对
+"""
+import argparse
+import time
+
+from corpus import iter_cached_responses, sample_response, html_to_read_json, synthetic_read_page
+
+from ngamonitor.parsers import load_read_json, parse_read_json, extract_html_comments
+
+
+def legacy_extract_comments(response, post_id):
+    """重写前的parse_post楼层提取逻辑，作为比对基准"""
+    comments = []
+    floors = response.css('div[id^="post"]')
+    for floor in floors:
+        post_id_attr = floor.attrib.get('id', '')
+        if post_id_attr == 'post1':
+            continue
+        if post_id_attr and floors.index(floor) == 0:
+            continue
+        content = ''.join(floor.css('.postcontent ::text').getall()).strip()
+        if not content:
+            continue
+        author = floor.css('a.author::text').get() or floor.css('.author::text').get()
+        floor_num = floor.css('span.floor::text').get('')
+        post_time = floor.css('span.postInfo::text').re_first(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}')
+        comments.append({
+            'post_id': post_id,
+            'author': author,
+            'content': content,
+            'floor': floor_num.replace('#', '') if floor_num else '',
+            'post_time': post_time
+        })
+    if not comments:
+        for floor in response.css('div.reply,div.postbox.reply'):
+            content = ''.join(floor.css('.postcontent ::text').getall()).strip()
+            if not content:
+                continue
+            author = floor.css('a.author::text').get() or floor.css('.author::text').get()
+            floor_num = floor.css('span.floor::text').get('')
+            post_time = floor.css('span.postInfo::text').re_first(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}')
+            comments.append({
+                'post_id': post_id,
+                'author': author,
+                'content': content,
+                'floor': floor_num.replace('#', '') if floor_num else '',
+                'post_time': post_time
+            })
+    return comments
+
+
+def fresh(page):
+    # 每次用原始body重新生成响应，避免复用已构建的选择器树
+    return page.replace(body=page.body)
+
+
+def run_legacy(page):
+    return legacy_extract_comments(fresh(page), 0)
+
+
+def run_single_pass(page):
+    return extract_html_comments(fresh(page).selector.root, 0)
+
+
+def run_legacy_prebuilt(page):
+    return legacy_extract_comments(page, 0)
+
+
+def run_single_pass_prebuilt(page):
+    return extract_html_comments(page.selector.root, 0)
+
+
+def run_json(text):
+    data = load_read_json(text)
+    return parse_read_json(data, 0) if data is not None else (None, [])
+
+
+def bench(label, func, inputs, size, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for value in inputs:
+            func(value)
+    elapsed = time.perf_counter() - start
+    pages = len(inputs) * repeat
+    print(f'  {label:<12} {pages:>6} 页  {pages / elapsed:>10.1f} 页/秒  平均 {size / max(len(inputs), 1) / 1024:>7.1f} KB/页')
+
+
+def bench_corpus(name, pages, repeat, with_json=True):
+    texts = [html_to_read_json(page) for page in pages]
+    html_size = sum(len(p.body) for p in pages)
+    for page in pages:
+        page.selector  # 预先构建HTML树，单独衡量楼层提取本身的开销
+    print(f'{name}:')
+    bench('旧版CSS', run_legacy, pages, html_size, repeat)
+    bench('单次遍历', run_single_pass, pages, html_size, repeat)
+    bench('旧版(仅提取)', run_legacy_prebuilt, pages, html_size, repeat)
+    bench('单次(仅提取)', run_single_pass_prebuilt, pages, html_size, repeat)
+    if with_json:
+        bench('JSON', run_json, texts, sum(len(t.encode('utf-8')) for t in texts), repeat)
+
+
+def check(pages):
+    """旧实现有结果的页面必须完全一致；旧实现为空的页面列出新实现额外识别的楼层数"""
+    same = differ = recovered = 0
+    for page in pages:
+        old = legacy_extract_comments(page, 0)
+        new = extract_html_comments(page.selector.root, 0)
+        if old == new:
+            same += 1
+        elif not old:
+            recovered += len(new)
+        else:
+            differ += 1
+            print(f'不一致: {page.url} 旧={len(old)} 新={len(new)}')
+    print(f'一致 {same} 页，不一致 {differ} 页，旧实现为空的页面新增识别 {recovered} 个楼层')
+    return differ == 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--floors', type=int, default=200)
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args()
+
+    cached = list(iter_cached_responses('/read.php')) + [sample_response()]
+    synthetic = [synthetic_read_page(args.floors, 'div'), synthetic_read_page(args.floors, 'table')]
+    if args.check:
+        raise SystemExit(0 if check(cached + synthetic) else 1)
+
+    bench_corpus('缓存页面', cached, args.repeat)
+    bench_corpus(f'{args.floors}楼合成页面(div结构)', synthetic[:1], args.repeat * 10, with_json=False)
+    bench_corpus(f'{args.floors}楼合成页面(tr结构)', synthetic[1:], args.repeat * 10)
+
+
+if __name__ == '__main__':
+    main()
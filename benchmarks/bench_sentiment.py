@@ -0,0 +1,58 @@
+"""情感分析基准：逐条SnowNLP(text).sentiments与NumPy批量实现的吞吐对比，并检查两者结果是否一致
+
+用法:
+    python benchmarks/bench_sentiment.py
+    python benchmarks/bench_sentiment.py --limit 300 --batch 1 16 64 256
+"""
+import argparse
+import time
+
+from corpus import iter_cached_responses
+
+from snownlp import SnowNLP
+
+from ngamonitor.nlp import get_scorer
+from ngamonitor.sentiment import split_chunks
+
+
+def load_chunks(limit):
+    """主楼和回帖正文按管道的规则分块"""
+    texts = []
+    for response in iter_cached_responses('/read.php'):
+        texts.append(''.join(response.css('#postcontent0 ::text').getall()))
+        texts.extend(response.css('[id^=postcontent]::text').getall())
+    chunks = [chunk for text in texts if text.strip() for chunk in split_chunks(text)]
+    return chunks[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--limit', type=int, default=500, help='参与测试的文本块数')
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 16, 64, 256], help='NumPy实现的批大小')
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.limit)
+    print(f'{len(chunks)} 块，共 {sum(len(c) for c in chunks)} 字')
+
+    start = time.perf_counter()
+    scorer = get_scorer()
+    SnowNLP('预热').sentiments
+    print(f'模型加载 {time.perf_counter() - start:.1f}s')
+
+    start = time.perf_counter()
+    expected = [SnowNLP(chunk).sentiments for chunk in chunks]
+    seconds = time.perf_counter() - start
+    print(f"{'实现':<16}{'批大小':>8}{'docs/s':>12}{'最大误差':>14}")
+    print(f"{'snownlp':<16}{1:>8}{len(chunks) / seconds:>12.1f}{0:>14.1e}")
+    for size in args.batch:
+        start = time.perf_counter()
+        values = []
+        for i in range(0, len(chunks), size):
+            values.extend(scorer.score_many(chunks[i:i + size]))
+        seconds = time.perf_counter() - start
+        error = max(abs(a - b) for a, b in zip(expected, values)) if values else 0.0
+        print(f"{'numpy':<16}{size:>8}{len(chunks) / seconds:>12.1f}{error:>14.1e}")
+
+
+if __name__ == '__main__':
+    main()
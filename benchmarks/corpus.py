@@ -0,0 +1,101 @@
+"""基准测试用语料：读取.scrapy/httpcache中的缓存响应和nga_sample.html，不访问网络"""
+import os
+import sys
+import glob
+import json
+import pickle
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from scrapy.http import Headers, HtmlResponse, Request
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.gz import gunzip
+from w3lib.http import headers_raw_to_dict
+
+CACHE_DIR = os.path.join(ROOT, '.scrapy', 'httpcache', 'nga_monitor')
+SAMPLE_HTML = os.path.join(ROOT, 'nga_sample.html')
+
+
+def iter_cached_responses(pattern=None, status=200, cache_dir=CACHE_DIR):
+    """按FilesystemCacheStorage的目录结构逐个还原缓存响应"""
+    for path in sorted(glob.glob(os.path.join(cache_dir, '*', '*'))):
+        with open(os.path.join(path, 'pickled_meta'), 'rb') as f:
+            meta = pickle.load(f)
+        if pattern and pattern not in meta['url']:
+            continue
+        if status is not None and meta['status'] != status:
+            continue
+        with open(os.path.join(path, 'response_headers'), 'rb') as f:
+            headers = Headers(headers_raw_to_dict(f.read()))
+        with open(os.path.join(path, 'response_body'), 'rb') as f:
+            body = f.read()
+        # 缓存中间件位于解压中间件之前，落盘的是压缩后的原始响应
+        if b'gzip' in headers.get(b'Content-Encoding', b''):
+            body = gunzip(body)
+            del headers[b'Content-Encoding']
+        respcls = responsetypes.from_args(headers=headers, url=meta['url'], body=body)
+        yield respcls(url=meta['response_url'], headers=headers, status=meta['status'],
+                      body=body, request=Request(meta['url']))
+
+
+def sample_response():
+    with open(SAMPLE_HTML, 'rb') as f:
+        body = f.read()
+    return HtmlResponse(url='https://bbs.nga.cn/read.php?tid=0', body=body, encoding='gb18030')
+
+
+def html_to_read_json(response):
+    """把真实read.php页面改写为__output=11格式的JSON，用于对比两种解析路径"""
+    rows = {}
+    users = {}
+    for node in response.css('[id^=postcontent]'):
+        index = node.attrib['id'][len('postcontent'):]
+        if not index.isdigit():
+            continue
+        author_href = response.css(f'#postauthor{index}::attr(href)').get('')
+        uid = author_href.rsplit('uid=', 1)[-1] if 'uid=' in author_href else '0'
+        users.setdefault(uid, {'uid': int(uid) if uid.isdigit() else 0, 'username': f'UID:{uid}'})
+        rows[str(len(rows))] = {
+            'lou': int(index),
+            'authorid': users[uid]['uid'],
+            'content': ''.join(node.css('::text').getall()),
+            'postdate': response.css(f'#postdate{index}::text').get(''),
+        }
+    data = {'data': {'__U': users, '__R': rows, '__R__ROWS': len(rows), '__R__ROWS_PAGE': 20}}
+    return json.dumps(data, ensure_ascii=False)
+
+
+def synthetic_read_page(floors, layout='table'):
+    """以nga_sample.html的页面外壳生成指定楼层数的read.php页面
+
+    layout='table' 为NGA当前的tr#post1strowN结构，'div' 为旧版div[id^=post]结构。
+    """
+    with open(SAMPLE_HTML, 'rb') as f:
+        shell = f.read().decode('gb18030')
+    head = shell[:shell.index('<body>') + len('<body>')]
+    parts = []
+    for i in range(floors):
+        text = f'第{i}楼：国服客服回复太慢了，BUG一直没修，退款流程也很麻烦。' * (1 + i % 3)
+        minute = f'{i % 60:02d}'
+        if layout == 'div':
+            parts.append(
+                f"<div id='post{i + 1}' class='postbox{' reply' if i else ''}'>"
+                f"<a class='author' href='nuke.php?func=ucp&uid={1000 + i}'>user{i}</a>"
+                f"<span class='floor'>#{i}</span><span class='postInfo'>2025-07-29 16:{minute}</span>"
+                f"<div class='postcontent ubbcode'>{text}<br/>[quote]引用[/quote]</div></div>"
+            )
+        else:
+            parts.append(
+                f"<table class='forumbox postbox'><tr id='post1strow{i}' class='postrow row{1 + i % 2}'>"
+                f"<td class='c1'><span id='posterinfo{i}' class='posterinfo'>"
+                f"<a href='nuke.php?func=ucp&uid={1000 + i}' id='postauthor{i}' class='author b'></a></span></td>"
+                f"<td class='c2' id='postcontainer{i}'><div class='postBtnPos' id='postBtnPos{i}'></div>"
+                f"<div class='postInfo' id='postInfo{i}'><span id='postdate{i}' title='reply time'>2025-07-29 16:{minute}</span></div>"
+                f"<span id='postcontentandsubject{i}'><h3 id='postsubject{i}'></h3><br/>"
+                f"<span id='postcontent{i}' class='postcontent ubbcode'>{text}<br/>[quote]引用[/quote]</span></span>"
+                f"<div id='postsign{i}' class='x'></div></td></tr></table>"
+            )
+    body = head + ''.join(parts) + '</body></html>'
+    return HtmlResponse(url='https://bbs.nga.cn/read.php?tid=1', body=body.encode('gb18030'), encoding='gb18030')
@@ -0,0 +1,202 @@
+"""离线回放基准：把httpcache中的缓存响应和合成页面依次送入parse_forum、parse_post和NgaMonitorPipeline
+
+不访问网络，输出条目吞吐、各回调耗时分位数和进程峰值内存，用于上线前发现性能回退。
+
+用法:
+    python benchmarks/replay.py                       # 缓存响应 + 20个200楼合成页面，回放1轮
+    python benchmarks/replay.py --save data/replay.json
+    python benchmarks/replay.py --compare data/replay.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs, urlparse
+
+from corpus import ROOT, iter_cached_responses, synthetic_read_page
+
+from scrapy.http import Request
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+from scrapy.utils.test import get_crawler
+
+from ngamonitor.pipelines import NgaMonitorPipeline
+from ngamonitor.spiders.nga_monitor import NgaMonitorSpider
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），平台不支持时返回None"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux单位为KB，macOS为字节
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def make_spider(state_dir):
+    settings = get_project_settings().copy_to_dict()
+    settings.update({
+        'CRAWL_STATE_PATH': os.path.join(state_dir, 'crawl_state.db'),
+        'LOG_ENABLED': False,
+    })
+    # Crawler要求先安装settings中指定的reactor，回放本身不启动reactor
+    if settings.get('TWISTED_REACTOR'):
+        install_reactor(settings['TWISTED_REACTOR'])
+    crawler = get_crawler(NgaMonitorSpider, settings)
+    spider = NgaMonitorSpider.from_crawler(crawler, full='1')
+    crawler.spider = spider
+    return spider
+
+
+def query_value(url, name, default=None):
+    values = parse_qs(urlparse(url).query).get(name)
+    return values[0] if values else default
+
+
+def load_corpus(floors, synthetic):
+    forums = list(iter_cached_responses('thread.php'))
+    posts = list(iter_cached_responses('/read.php'))
+    template = synthetic_read_page(floors, 'table')
+    for i in range(synthetic):
+        url = f'https://bbs.nga.cn/read.php?tid={900000000 + i}'
+        posts.append(template.replace(url=url, request=Request(url)))
+    return forums, posts
+
+
+def replay(spider, pipeline, forums, posts, timings):
+    """回放一轮，返回经过管道的条目数"""
+    known = {}
+    for response in forums:
+        fid = int(query_value(response.url, 'fid', 0))
+        request = spider.make_forum_request(fid, 1, {'started': time.time(), 'previous': None, 'new_tids': 0, 'watermark': None})
+        response = response.replace(request=request)
+        start = time.perf_counter()
+        for result in spider.parse_forum(response):
+            if isinstance(result, Request) and 'item' in result.meta:
+                known[result.meta['item']['post_id']] = result.meta['item']
+        timings['parse_forum'].append(time.perf_counter() - start)
+
+    count = 0
+    for response in posts:
+        tid = int(query_value(response.url, 'tid', 0))
+        item = dict(known.get(tid) or {
+            'fid': 0, 'post_id': tid, 'title': f'回放帖子{tid}', 'url': f'https://bbs.nga.cn/read.php?tid={tid}',
+            'author': None, 'reply_count': 0, 'post_time': None, 'crawl_time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        request = spider.make_post_request(item, 1, 1, -1)
+        response = response.replace(request=request)
+        start = time.perf_counter()
+        items = [result for result in spider.parse_post(response) if not isinstance(result, Request)]
+        timings['parse_post'].append(time.perf_counter() - start)
+        for result in items:
+            start = time.perf_counter()
+            pipeline.process_item(result, spider)
+            timings['pipeline'].append(time.perf_counter() - start)
+            count += 1
+    return count
+
+
+def run(args):
+    forums, posts = load_corpus(args.floors, args.synthetic)
+    state_dir = tempfile.mkdtemp(prefix='nga_replay_')
+    try:
+        spider = make_spider(state_dir)
+        pipeline = NgaMonitorPipeline()
+        # 预热一轮（SnowNLP模型加载、XPath编译等），不计入结果
+        replay(spider, pipeline, forums, posts[:1], {'parse_forum': [], 'parse_post': [], 'pipeline': []})
+        timings = {'parse_forum': [], 'parse_post': [], 'pipeline': []}
+        items = 0
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            items += replay(spider, pipeline, forums, posts, timings)
+        elapsed = time.perf_counter() - start
+        spider.close_state(spider)
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    result = {
+        'forum_pages': len(forums), 'post_pages': len(posts), 'repeat': args.repeat,
+        'items': items, 'seconds': elapsed, 'items_per_sec': items / elapsed if elapsed else 0.0,
+        'peak_rss_mb': peak_rss_mb(), 'callbacks': {},
+    }
+    for name, values in timings.items():
+        result['callbacks'][name] = {
+            'calls': len(values),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+        }
+    return result
+
+
+def report(result):
+    print(f"列表页 {result['forum_pages']} 个，帖子页 {result['post_pages']} 个，回放 {result['repeat']} 轮")
+    print(f"条目 {result['items']} 个，耗时 {result['seconds']:.2f}s，吞吐 {result['items_per_sec']:.1f} items/s")
+    rss = result['peak_rss_mb']
+    print(f"峰值内存 {rss:.1f} MB" if rss is not None else '峰值内存 不可用')
+    print(f"  {'回调':<12}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for name, stats in result['callbacks'].items():
+        print(f"  {name:<12}{stats['calls']:>8}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+
+def compare(result, baseline, tolerance):
+    """吞吐下降或p95耗时上升超过tolerance比例时视为回退"""
+    regressions = []
+    if result['items_per_sec'] < baseline['items_per_sec'] * (1 - tolerance):
+        regressions.append(f"吞吐 {baseline['items_per_sec']:.1f} -> {result['items_per_sec']:.1f} items/s")
+    for name, stats in result['callbacks'].items():
+        old = baseline.get('callbacks', {}).get(name)
+        if old and old['p95_ms'] and stats['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name} p95 {old['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms")
+    for line in regressions:
+        print(f'性能回退: {line}')
+    if not regressions:
+        print(f'与基线相比未发现超过{tolerance:.0%}的回退')
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--floors', type=int, default=200, help='合成页面的楼层数')
+    parser.add_argument('--synthetic', type=int, default=20, help='合成页面个数')
+    parser.add_argument('--save', help='把结果写入JSON文件作为基线')
+    parser.add_argument('--compare', help='与之前保存的基线比较')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    # 与scrapy命令一样从项目根目录读取scrapy.cfg和settings
+    os.chdir(ROOT)
+    result = run(args)
+    report(result)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        raise SystemExit(0 if compare(result, baseline, args.tolerance) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
 @echo off
-scrapy crawl nga_monitor -o data/output.json
+scrapy crawl nga_monitor
+python export_parquet.py
 pause
\ No newline at end of file
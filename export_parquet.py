@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import closing
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from ngamonitor.storage import PostStore
+
+# 把data/nga.db增量导出为按日期和板块分区的Parquet数据集：
+#   <输出目录>/posts/date=2024-05-01/fid=7/part-<导出批次>-<序号>.parquet
+#   <输出目录>/comments/date=2024-05-01/fid=7/...（按post_id关联，分区与所属帖子相同）
+# 每次只导出上次导出之后更新过的帖子（进度保存在<输出目录>/_export_state.json），新文件追加到对应分区，
+# 已有文件不改写。帖子有新回帖时会整帖（含全部回帖）再次导出，读取时只保留每个帖子updated最大的一次（见read_table）。
+
+DB_FILE = 'data/nga.db'
+OUTPUT_DIR = 'data/parquet'
+STATE_FILE = '_export_state.json'
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+# 分区列date、fid只体现在目录名中，不写入文件
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string()), ('fid', pa.int64())]), flavor='hive')
+
+POST_SCHEMA = pa.schema([
+    ('post_id', pa.int64()),
+    ('title', pa.string()),
+    ('url', pa.string()),
+    ('author', pa.string()),
+    ('content', pa.string()),
+    ('reply_count', pa.int64()),
+    ('post_time', pa.string()),
+    ('crawl_time', pa.string()),
+    ('sentiment', pa.float64()),
+    ('risk_level', pa.int64()),
+    ('risk_keywords', pa.list_(pa.string())),
+    ('risk_hits', pa.string()),
+    ('risk_density', pa.float64()),
+    ('lite', pa.bool_()),
+    ('comment_count', pa.int64()),
+    ('comment_sentiment_mean', pa.float64()),
+    ('comment_sentiment_min', pa.float64()),
+    ('negative_floor_ratio', pa.float64()),
+    ('updated', pa.float64()),
+])
+
+COMMENT_SCHEMA = pa.schema([
+    ('post_id', pa.int64()),
+    ('floor', pa.int64()),
+    ('author', pa.string()),
+    ('content', pa.string()),
+    ('post_time', pa.string()),
+    ('sentiment', pa.float64()),
+    ('risk_keywords', pa.list_(pa.string())),
+    ('updated', pa.float64()),
+])
+
+# 中断后重新导出可能产生updated相同的重复行，按这些列去掉
+KEYS = {'posts': ['post_id'], 'comments': ['post_id', 'floor', 'author', 'content', 'post_time']}
+
+
+def partition_date(post):
+    """分区日期取发帖日期，没有时取抓取日期"""
+    for field in ('post_time', 'crawl_time'):
+        match = DATE_PATTERN.match(post.get(field) or '')
+        if match:
+            return match.group(0)
+    return 'unknown'
+
+
+def post_row(post):
+    row = {name: post.get(name) for name in POST_SCHEMA.names}
+    row['risk_hits'] = json.dumps(post.get('risk_hits') or {}, ensure_ascii=False)
+    return row
+
+
+def comment_row(post, comment):
+    row = {name: comment.get(name) for name in COMMENT_SCHEMA.names}
+    row['floor'] = int(comment['floor']) if str(comment.get('floor') or '').isdigit() else None
+    row['updated'] = post['updated']
+    return row
+
+
+def to_table(rows, schema):
+    return pa.Table.from_pydict({name: [row[name] for row in rows] for name in schema.names}, schema=schema)
+
+
+def write_partitions(root, table_name, schema, groups, basename):
+    """每个分区写一个新文件，返回写入的文件数"""
+    for (date, fid), rows in groups.items():
+        directory = os.path.join(root, table_name, f'date={date}', f'fid={fid}')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{basename}.parquet')
+        if os.path.exists(path):
+            raise FileExistsError(f"导出文件已存在，拒绝覆盖：{path}")
+        # 先写临时文件（以.开头，读取时被忽略）再改名，读取方不会看到写了一半的文件
+        temp = os.path.join(directory, f'.{basename}.tmp')
+        pq.write_table(to_table(rows, schema), temp, compression='zstd')
+        os.rename(temp, path)
+    return len(groups)
+
+
+def load_state(root):
+    path = os.path.join(root, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(root, state):
+    path = os.path.join(root, STATE_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def export(db_file=DB_FILE, root=OUTPUT_DIR, batch_size=5000, full=False):
+    """导出上次之后更新过的帖子和回帖，返回(帖子数, 回帖数, 文件数)；full为True时清空已导出的数据重新生成"""
+    if full:
+        for table in ('posts', 'comments'):
+            shutil.rmtree(os.path.join(root, table), ignore_errors=True)
+    os.makedirs(root, exist_ok=True)
+    state = {} if full else load_state(root)
+    # 同一秒内多次导出的文件名也不能相同
+    run = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:12]}"
+    posts_total = comments_total = files = 0
+    last = (state['updated'], state['post_id']) if 'updated' in state else None
+    with closing(PostStore(db_file)) as store:
+        for chunk, posts in enumerate(store.iter_updated(last, batch_size)):
+            post_groups, comment_groups = {}, {}
+            for post in posts:
+                key = (partition_date(post), post.get('fid'))
+                post_groups.setdefault(key, []).append(post_row(post))
+                comment_groups.setdefault(key, []).extend(comment_row(post, c) for c in post['comments'])
+                comments_total += len(post['comments'])
+            basename = f'part-{run}-{chunk:05d}'
+            files += write_partitions(root, 'posts', POST_SCHEMA, post_groups, basename)
+            files += write_partitions(
+                root, 'comments', COMMENT_SCHEMA, {k: v for k, v in comment_groups.items() if v}, basename
+            )
+            posts_total += len(posts)
+            # 每批写完就记录进度，中途失败时下次从这里继续
+            save_state(root, {'updated': posts[-1]['updated'], 'post_id': posts[-1]['post_id'], 'run': run})
+    return posts_total, comments_total, files
+
+
+def read_table(root=OUTPUT_DIR, table='posts', fid=None, start=None, end=None, columns=None):
+    """按板块和日期范围读取（只扫描命中的分区），每个帖子只保留最后一次导出的行，返回pandas.DataFrame
+
+    start、end为'YYYY-MM-DD'，均包含在内；fid可以是单个板块或列表。
+    """
+    dataset = ds.dataset(os.path.join(root, table), format='parquet', partitioning=PARTITIONING)
+    condition = None
+    if fid is not None:
+        fids = fid if isinstance(fid, (list, tuple, set)) else [fid]
+        condition = ds.field('fid').isin([int(f) for f in fids])
+    if start is not None:
+        condition = (ds.field('date') >= start) if condition is None else condition & (ds.field('date') >= start)
+    if end is not None:
+        condition = (ds.field('date') <= end) if condition is None else condition & (ds.field('date') <= end)
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + KEYS[table] + ['updated']))
+    df = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    df = df[df['updated'] == df.groupby('post_id')['updated'].transform('max')]
+    return df.drop_duplicates(KEYS[table]).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='把SQLite数据库增量导出为按日期和板块分区的Parquet数据集')
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('-o', '--output', default=OUTPUT_DIR)
+    parser.add_argument('--batch', type=int, default=5000, help='每批读取的帖子数')
+    parser.add_argument('--full', action='store_true', help='忽略上次导出的进度，全部重新导出')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"数据库不存在：{args.db}")
+    else:
+        posts, comments, files = export(args.db, args.output, args.batch, args.full)
+        print(f"已导出 {posts} 个帖子、{comments} 条回帖，新增 {files} 个文件：{args.output}")
@@ -1,9 +1,19 @@
 import pandas as pd
-import json
+import os
+from contextlib import closing
 
-# 读取JSON文件
-with open('output.json', 'r', encoding='utf-8') as f:
-    data = json.load(f)
+from merge_outputs import merge
+from ngamonitor.storage import PostStore
+
+DB_FILE = 'data/nga.db'
+FEED_DIR = 'data/feed'
+
+# 优先读取爬虫写入的SQLite数据库，没有时读取JSON Lines输出（同一帖子的多条记录合并为一条）
+if os.path.exists(DB_FILE):
+    with closing(PostStore(DB_FILE)) as store:
+        data = store.load_posts()
+else:
+    data = merge([FEED_DIR])
 
 # 将JSON数据转换为DataFrame
 df = pd.json_normalize(data)
@@ -17,4 +27,4 @@ else:
 # 保存为Excel文件
 df.to_excel('nga_posts.xlsx', index=False, engine='openpyxl')
 
-print("Excel文件已生成：nga_posts.xlsx")
\ No newline at end of file
+print("Excel文件已生成：nga_posts.xlsx")
@@ -0,0 +1,48 @@
+import argparse
+import json
+
+from ngamonitor.feed import iter_records
+
+# 合并多个worker各自的输出（JSON Lines目录/文件或旧版JSON数组文件）：同一帖子保留爬取时间最新的一份，回帖按楼层合并去重
+
+
+def comment_key(comment):
+    return comment.get('floor') or comment.get('content')
+
+
+def merge_item(current, item):
+    """合并同一帖子的两条记录"""
+    newer, older = (item, current) if item.get('crawl_time', '') >= current.get('crawl_time', '') else (current, item)
+    comments = {comment_key(c): c for c in older.get('comments') or []}
+    comments.update((comment_key(c), c) for c in newer.get('comments') or [])
+    merged = dict(newer)
+    merged['comments'] = sorted(comments.values(), key=lambda c: int(c['floor']) if str(c.get('floor', '')).isdigit() else 0)
+    if not merged.get('content'):
+        merged['content'] = older.get('content')
+    return merged
+
+
+def merge(paths):
+    posts = {}
+    for path in paths:
+        for item in iter_records(path):
+            post_id = item.get('post_id')
+            current = posts.get(post_id)
+            posts[post_id] = item if current is None else merge_item(current, item)
+    return list(posts.values())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='合并多个worker的输出文件')
+    parser.add_argument('inputs', nargs='+', help='各worker的输出目录（JSONL_FEED_DIR/<worker>）或文件')
+    parser.add_argument('-o', '--output', default='output.jsonl')
+    args = parser.parse_args()
+
+    result = merge(args.inputs)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        if args.output.endswith('.json'):
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        else:
+            for item in result:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+    print(f"已合并 {len(args.inputs)} 个输入，共 {len(result)} 个帖子：{args.output}")
@@ -13,10 +13,15 @@ import time
 import signal
 import atexit
 import queue
+from contextlib import closing
 
 # 添加Scrapy项目路径到系统路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from merge_outputs import merge_item
+from ngamonitor import feed
+from ngamonitor.storage import PostStore, modified_time
+
 class NgaMonitorGUI:
     # 板块ID到名称的映射
     FID_NAME_MAP = {
@@ -45,7 +50,14 @@ class NgaMonitorGUI:
         self.crawler_process = None
         self.crawler_running = False
         self.crawler_thread = None
-        self.output_file = "output.json"
+        # 爬虫的JSON Lines输出目录（JSONL_FEED_DIR，多worker时为其下各worker子目录），
+        # 没有数据库时每个目录从上次读到的位置增量读取
+        self.feed_dir = "data/feed"
+        self.feed_readers = {}
+        self.feed_posts = {}
+        # 爬虫写入的SQLite数据库（SQLITE_STORAGE_PATH），存在时优先从中读取最新的max_posts条
+        self.db_file = "data/nga.db"
+        self.max_posts = 2000
         
         # 创建UI
         self.create_widgets()
@@ -191,13 +203,12 @@ class NgaMonitorGUI:
     def load_sample_data(self):
         # 加载示例数据
         try:
-            if os.path.exists(self.output_file):
-                with open(self.output_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.posts = data
-                    self.update_data_table()
-                    self.update_analysis()
-                    self.add_log(f"加载数据成功，共{len(data)}条记录")
+            if os.path.exists(self.db_file) or feed.directories(self.feed_dir):
+                data = self.read_posts()
+                self.posts = data
+                self.update_data_table()
+                self.update_analysis()
+                self.add_log(f"加载数据成功，共{len(data)}条记录")
         except Exception as e:
             self.add_log(f"加载数据失败: {str(e)}")
     
@@ -428,11 +439,7 @@ class NgaMonitorGUI:
     def run_crawler(self):
         """运行Scrapy爬虫"""
         try:
-            # 删除旧数据文件
-            if os.path.exists(self.output_file):
-                os.remove(self.output_file)
-            
-            # 构建命令
+            # 构建命令（数据由管道写入数据库和JSON Lines输出，不再使用-o）
             command = [
                 "scrapy",
                 "crawl",
@@ -445,9 +452,13 @@ class NgaMonitorGUI:
                 "-s", f"CONCURRENT_REQUESTS={self.settings.get('concurrent_requests', 4)}",
                 "-s", f"RETRY_TIMES={self.settings.get('retry_times', 2)}",
                 "-s", f"CLOSESPIDER_ITEMCOUNT={self.settings.get('max_itemcount', 100)}",
-                "-o",
-                self.output_file
             ]
+            # 常驻监控：爬虫进程不退出，按板块活跃度自适应轮询，且不受最大爬取数限制
+            if self.settings.get('daemon'):
+                command += ["-a", "daemon=1", "-s", "CLOSESPIDER_ITEMCOUNT=0"]
+            # 轻量模式：只为标题预筛命中的帖子下载正文
+            if self.settings.get('lite'):
+                command += ["-a", "lite=1"]
                 
             # 在Windows上使用CREATE_NEW_PROCESS_GROUP
             creationflags = 0
@@ -498,8 +509,8 @@ class NgaMonitorGUI:
             self.read_output(self.crawler_process.stderr, True)
             
              # 加载最终数据
-            if os.path.exists(self.output_file):
-                self.load_data_from_file()
+            self.load_data_from_file()
+            self.export_parquet()
             
             # 更新状态
             return_code = self.crawler_process.returncode
@@ -521,29 +532,54 @@ class NgaMonitorGUI:
                 self.crawler_running = False
                 self.root.after(0, self.update_buttons_state)
     
+    def read_posts(self):
+        """读取帖子数据：优先查询SQLite数据库（爬虫运行中也可读），否则增量读取JSON Lines输出"""
+        if os.path.exists(self.db_file):
+            with closing(PostStore(self.db_file)) as store:
+                return store.load_posts(limit=self.max_posts)
+        # 只解析上次读取之后新增的记录，同一帖子的多条记录合并
+        for directory in feed.directories(self.feed_dir):
+            reader = self.feed_readers.setdefault(directory, feed.FeedReader(directory))
+            for item in reader.read():
+                post_id = item.get('post_id')
+                current = self.feed_posts.get(post_id)
+                self.feed_posts[post_id] = item if current is None else merge_item(current, item)
+        posts = sorted(self.feed_posts.values(), key=lambda p: p.get('crawl_time') or '', reverse=True)
+        return posts[:self.max_posts]
+
+    def data_modified_time(self):
+        if os.path.exists(self.db_file):
+            return modified_time(self.db_file)
+        return feed.modified_time(self.feed_dir)
+
     def load_data_from_file(self):
-        """从文件加载数据并更新UI"""
-        if os.path.exists(self.output_file) and os.path.getsize(self.output_file) > 0:
-            try:
-                with open(self.output_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.root.after(0, lambda: self.safe_update_data(data))
-                    self.add_log(f"已加载 {len(data)} 条帖子数据")
-            except Exception as e:
-                self.add_log(f"加载数据失败: {str(e)}")
-        else:
+        """从数据库或JSON Lines输出加载数据并更新UI"""
+        if not os.path.exists(self.db_file) and not feed.directories(self.feed_dir):
             self.add_log("数据文件为空")
+            return
         try:
-            with open(self.output_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.posts = data
-                self.root.after(0, lambda: self.safe_update_data(data))
-                self.root.after(0, self.update_data_table)
-                self.root.after(0, self.update_analysis)
-                self.add_log(f"已加载 {len(data)} 条帖子数据")
+            data = self.read_posts()
+            self.posts = data
+            self.root.after(0, lambda: self.safe_update_data(data))
+            self.add_log(f"已加载 {len(data)} 条帖子数据")
         except Exception as e:
             self.add_log(f"加载数据失败: {str(e)}")
 
+    def export_parquet(self):
+        """爬取结束后把新增/更新的帖子追加到Parquet数据集（需要安装pyarrow）"""
+        if not os.path.exists(self.db_file):
+            return
+        try:
+            from export_parquet import export
+        except ImportError:
+            self.add_log("未安装pyarrow，跳过Parquet导出")
+            return
+        try:
+            posts, comments, files = export(self.db_file)
+            self.add_log(f"Parquet增量导出：{posts} 个帖子、{comments} 条回帖")
+        except Exception as e:
+            self.add_log(f"Parquet导出失败: {str(e)}")
+
     def safe_update_data(self, data):
         """安全更新数据并显示进度"""
         try:
@@ -672,6 +708,11 @@ class NgaMonitorGUI:
         retry_entry = ttk.Entry(strategy_frame, width=30)
         retry_entry.grid(row=2, column=1, padx=10, pady=10)
         retry_entry.insert(0, str(self.settings.get('retry_times', 2)))
+
+        daemon_var = tk.BooleanVar(value=bool(self.settings.get('daemon', False)))
+        ttk.Checkbutton(strategy_frame, text="常驻监控模式（按板块活跃度自适应轮询）", variable=daemon_var).grid(row=3, column=0, columnspan=2, padx=10, pady=10, sticky=tk.W)
+        lite_var = tk.BooleanVar(value=bool(self.settings.get('lite', False)))
+        ttk.Checkbutton(strategy_frame, text="轻量模式（只为标题命中风险词或热门的帖子下载正文）", variable=lite_var).grid(row=4, column=0, columnspan=2, padx=10, pady=10, sticky=tk.W)
         
         # 保存按钮
         save_btn = ttk.Button(settings_win, text="保存设置", command=lambda: self.save_settings(
@@ -683,12 +724,18 @@ class NgaMonitorGUI:
             retry_entry.get(),
             maxcount_entry.get(),
             cookie_entry.get(),
-            settings_win  # 传递窗口对象
+            settings_win,  # 传递窗口对象
+            daemon_var.get(),
+            lite_var.get()
         ))
         save_btn.pack(pady=10)
     
-    def save_settings(self, uid, fid, pages, download_delay=None, concurrent_requests=None, retry_times=None, max_itemcount=None, cookie=None, win=None):
+    def save_settings(self, uid, fid, pages, download_delay=None, concurrent_requests=None, retry_times=None, max_itemcount=None, cookie=None, win=None, daemon=None, lite=None):
         """保存设置到self.settings字典"""
+        pages = str(pages).strip()
+        if not pages.isdigit() or int(pages) < 1:
+            messagebox.showerror("设置错误", "爬取页数必须是正整数")
+            return
         self.settings['uid'] = uid
         self.settings['fid'] = fid
         self.settings['pages'] = pages
@@ -702,7 +749,11 @@ class NgaMonitorGUI:
             self.settings['max_itemcount'] = int(max_itemcount)
         if cookie is not None:
             self.settings['cookie'] = cookie
-        self.add_log(f"设置已保存: UID={uid}, FID={fid}, 页数={pages}, 延迟={download_delay}, 并发={concurrent_requests}, 重试={retry_times}, 最大数={max_itemcount}, Cookie={'已设置' if cookie else '未设置'}")
+        if daemon is not None:
+            self.settings['daemon'] = daemon
+        if lite is not None:
+            self.settings['lite'] = lite
+        self.add_log(f"设置已保存: UID={uid}, FID={fid}, 页数={pages}, 延迟={download_delay}, 并发={concurrent_requests}, 重试={retry_times}, 最大数={max_itemcount}, Cookie={'已设置' if cookie else '未设置'}, 常驻监控={'是' if self.settings.get('daemon') else '否'}, 轻量模式={'是' if self.settings.get('lite') else '否'}")
         messagebox.showinfo("设置保存", "设置已成功保存")
         if win is not None:
             win.destroy()
@@ -740,15 +791,14 @@ class NgaMonitorGUI:
                 except queue.Empty:
                     break
         
-            # 检查数据文件更新
-            if os.path.exists(self.output_file):
-                try:
-                    mod_time = os.path.getmtime(self.output_file)
-                    if not hasattr(self, 'last_mod_time') or mod_time > self.last_mod_time:
-                        self.last_mod_time = mod_time
-                        self.load_data_from_file()
-                except Exception as e:
-                    self.add_log(f"检查数据更新失败: {str(e)}")
+            # 检查数据更新（数据库在爬虫运行期间持续写入）
+            try:
+                mod_time = self.data_modified_time()
+                if mod_time is not None and (not hasattr(self, 'last_mod_time') or mod_time > self.last_mod_time):
+                    self.last_mod_time = mod_time
+                    self.load_data_from_file()
+            except Exception as e:
+                self.add_log(f"检查数据更新失败: {str(e)}")
         
             # 每1秒检查一次
             self.log_timer_id = self.root.after(1000, self.check_data_update)
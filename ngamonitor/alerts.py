@@ -0,0 +1,209 @@
+import json
+import logging
+import random
+import time
+from collections import deque
+from io import BytesIO
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.task import LoopingCall, deferLater
+from twisted.web.client import Agent, FileBodyProducer, HTTPConnectionPool, readBody
+from twisted.web.http_headers import Headers
+
+logger = logging.getLogger(__name__)
+
+
+class AlertDispatcher:
+    """异步预警发送：管道只把预警放进队列，由后台定时任务按时间窗口合并成摘要POST到Webhook
+
+    - 同一帖子在排队/发送中，或成功发送后的dedup_ttl秒内不再预警；被丢弃或发送失败的预警不计入
+    - 每个窗口把队列中的预警按max_batch条一组合并发送，队列超过max_queue时丢弃最早的
+    - 每条摘要UTF-8编码后不超过max_bytes字节（企业微信text.content上限2048），放不下的预警留到下一条，单条过长时截断
+    - 连接失败、超时、5xx、429或企业微信限流时按指数退避重试，超过max_retries次放弃；其他错误（如Webhook无效）直接放弃
+    - 统计：alerts/queued|suppressed|dropped|sent|failed|retries、alerts/queue_depth、alerts/latency_max
+    """
+
+    RATE_LIMITED = 45009
+    ELLIPSIS = '…'
+
+    def __init__(self, webhook, window=60, max_batch=10, dedup_ttl=3600, max_queue=1000,
+                 max_retries=5, backoff_base=2, backoff_max=300, timeout=10, stats=None, max_bytes=2048):
+        self.webhook = webhook
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.max_bytes = max_bytes
+        self.dedup_ttl = dedup_ttl
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.stats = stats
+        self.queue = deque()
+        # 已成功发送的key及发送时间
+        self.alerted = {}
+        # 排队中和发送中的key
+        self.waiting = set()
+        self.loop = None
+        # LoopingCall.start返回的Deferred，停止后等正在进行的flush结束才触发
+        self.loop_done = None
+        self.agent = None
+        self.pool = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        webhook = settings.get('ALERT_WEBHOOK_URL')
+        if not webhook:
+            return None
+        return cls(
+            webhook,
+            settings.getfloat('ALERT_DIGEST_WINDOW', 60),
+            settings.getint('ALERT_DIGEST_MAX', 10),
+            settings.getfloat('ALERT_DEDUP_TTL', 3600),
+            settings.getint('ALERT_QUEUE_MAX', 1000),
+            settings.getint('ALERT_MAX_RETRIES', 5),
+            settings.getfloat('ALERT_BACKOFF_BASE', 2),
+            settings.getfloat('ALERT_BACKOFF_MAX', 300),
+            settings.getfloat('ALERT_TIMEOUT', 10),
+            crawler.stats,
+            settings.getint('ALERT_DIGEST_MAX_BYTES', 2048),
+        )
+
+    def start(self):
+        from twisted.internet import reactor
+        self.pool = HTTPConnectionPool(reactor)
+        self.agent = Agent(reactor, connectTimeout=self.timeout, pool=self.pool)
+        self.loop = LoopingCall(self.flush)
+        # LoopingCall会等上一次flush返回的Deferred完成后才安排下一次，发送过程天然串行
+        self.loop_done = self.loop.start(self.window, now=False)
+        self.loop_done.addErrback(lambda failure: logger.error(f"预警发送任务异常退出: {failure.value!r}"))
+
+    @inlineCallbacks
+    def close(self):
+        """停止定时任务，发送队列中剩余的预警"""
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+        # 定时任务的flush可能还在发送，等它结束再发送剩余的预警，避免两个flush同时取队列
+        if self.loop_done is not None:
+            yield self.loop_done
+        yield self.flush()
+        if self.pool is not None:
+            yield self.pool.closeCachedConnections()
+
+    def submit(self, key, message):
+        """加入发送队列；key（帖子ID）正在排队/发送或dedup_ttl秒内已成功预警过则忽略，返回是否入队"""
+        now = time.time()
+        last = self.alerted.get(key)
+        if key in self.waiting or (last is not None and now - last < self.dedup_ttl):
+            self.inc('alerts/suppressed')
+            return False
+        if len(self.queue) >= self.max_queue:
+            _, dropped, _ = self.queue.popleft()
+            self.waiting.discard(dropped)
+            self.inc('alerts/dropped')
+        self.waiting.add(key)
+        self.queue.append((now, key, message))
+        self.inc('alerts/queued')
+        self.update_depth()
+        return True
+
+    @inlineCallbacks
+    def flush(self):
+        while self.queue:
+            batch = self.take_batch()
+            self.update_depth()
+            delivered = yield self.deliver(self.digest(batch))
+            now = time.time()
+            for _, key, _ in batch:
+                self.waiting.discard(key)
+                if delivered:
+                    self.alerted[key] = now
+            if len(self.alerted) > self.max_queue * 10:
+                self.alerted = {k: t for k, t in self.alerted.items() if now - t < self.dedup_ttl}
+            if delivered:
+                latency = now - batch[0][0]
+                self.inc('alerts/sent', len(batch))
+                if self.stats is not None:
+                    self.stats.max_value('alerts/latency_max', round(latency, 3))
+                    self.stats.set_value('alerts/latency_last', round(latency, 3))
+            else:
+                self.inc('alerts/failed', len(batch))
+
+    def take_batch(self):
+        """从队列取出下一条摘要的预警：最多max_batch条，且合并后不超过max_bytes字节"""
+        batch = [self.queue.popleft()]
+        while self.queue and len(batch) < self.max_batch:
+            if len(self.compose(batch + [self.queue[0]]).encode('utf-8')) > self.max_bytes:
+                break
+            batch.append(self.queue.popleft())
+        return batch
+
+    def digest(self, batch):
+        return self.truncate(self.compose(batch))
+
+    def compose(self, batch):
+        if len(batch) == 1:
+            return batch[0][2]
+        header = f"NGA高风险内容汇总（{len(batch)}条）"
+        return '\n\n'.join([header] + [f"[{i}] {message}" for i, (_, _, message) in enumerate(batch, 1)])
+
+    def truncate(self, content):
+        data = content.encode('utf-8')
+        if len(data) <= self.max_bytes:
+            return content
+        limit = self.max_bytes - len(self.ELLIPSIS.encode('utf-8'))
+        return data[:limit].decode('utf-8', errors='ignore') + self.ELLIPSIS
+
+    @inlineCallbacks
+    def deliver(self, content):
+        """发送一条消息，失败时指数退避重试，返回是否成功"""
+        from twisted.internet import reactor
+        body = json.dumps({'msgtype': 'text', 'text': {'content': content}}, ensure_ascii=False).encode('utf-8')
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                self.inc('alerts/retries')
+                yield deferLater(reactor, delay, lambda: None)
+            try:
+                ok, retryable, reason = yield self.post(body)
+            except Exception as e:
+                ok, retryable, reason = False, True, repr(e)
+            if ok:
+                returnValue(True)
+            logger.warning(f"预警发送失败（第{attempt + 1}次）: {reason}")
+            if not retryable:
+                break
+        logger.error(f"预警发送放弃: {reason}")
+        returnValue(False)
+
+    @inlineCallbacks
+    def post(self, body):
+        from twisted.internet import reactor
+        d = self.agent.request(
+            b'POST', self.webhook.encode('utf-8'),
+            Headers({'Content-Type': ['application/json; charset=utf-8']}),
+            FileBodyProducer(BytesIO(body)),
+        )
+        d.addTimeout(self.timeout, reactor)
+        response = yield d
+        text = yield readBody(response)
+        if response.code >= 300:
+            returnValue((False, response.code == 429 or response.code >= 500, f"HTTP {response.code}"))
+        try:
+            result = json.loads(text or b'{}')
+        except ValueError:
+            result = {}
+        # 企业微信机器人返回{"errcode": 0, "errmsg": "ok"}，限流（45009）等错误同样是HTTP 200
+        errcode = result.get('errcode', 0)
+        if errcode != 0:
+            returnValue((False, errcode == self.RATE_LIMITED, f"errcode {errcode}: {result.get('errmsg')}"))
+        returnValue((True, False, None))
+
+    def update_depth(self):
+        if self.stats is not None:
+            self.stats.set_value('alerts/queue_depth', len(self.queue))
+            self.stats.max_value('alerts/queue_depth_max', len(self.queue))
+
+    def inc(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
@@ -0,0 +1,169 @@
+import os
+import re
+import mmap
+import math
+import time
+import hashlib
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+
+
+class BloomFilter:
+    """基于mmap文件的布隆滤波器，内存占用固定，写入直接落盘"""
+
+    def __init__(self, path, capacity, error_rate):
+        self.path = path
+        self.bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        size = (self.bits + 7) // 8
+        # 文件大小与参数不符（修改了容量/误判率）时丢弃重建
+        if os.path.exists(path) and os.path.getsize(path) != size:
+            os.remove(path)
+        with open(path, 'a+b') as f:
+            if os.path.getsize(path) != size:
+                f.truncate(size)
+        self.file = open(path, 'r+b')
+        self.bitmap = mmap.mmap(self.file.fileno(), size)
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def contains(self, positions):
+        return all(self.bitmap[pos >> 3] & (1 << (pos & 7)) for pos in positions)
+
+    def add(self, positions):
+        for pos in positions:
+            self.bitmap[pos >> 3] |= 1 << (pos & 7)
+
+    def close(self):
+        self.bitmap.flush()
+        self.bitmap.close()
+        self.file.close()
+
+
+class PersistentBloomDupeFilter(RFPDupeFilter):
+    """跨运行持久化的请求去重过滤器
+
+    URL匹配DUPEFILTER_BLOOM_PATTERNS（或meta['bloom_dupefilter']为True）的请求写入磁盘上的布隆滤波器，
+    其余请求仍按Scrapy默认方式在内存中去重。请求可通过meta['dupefilter_key']指定去重键
+    （如帖子ID:回复数:页码），否则使用请求指纹。
+
+    request_seen只检查是否已记录；页面成功解析后由爬虫调用mark_seen才写入滤波器，
+    403、登录页或重试耗尽的请求调用forget，下次运行仍会重新请求。已调度未完成的键在本次运行内暂记在内存中，
+    避免同一页面重复排队。
+
+    过滤器按时间分代：每代覆盖 DUPEFILTER_BLOOM_TTL / DUPEFILTER_BLOOM_GENERATIONS 秒，
+    只保留最近GENERATIONS代，过期的代整体删除，因此记录在TTL内失效，磁盘和内存占用有上限。
+    """
+
+    def __init__(self, path=None, debug=False, *, fingerprinter=None, bloom_path='data/dupefilter',
+                 patterns=(r'/read\.php',), capacity=1000000, error_rate=0.001, ttl=7 * 86400,
+                 generations=4, stats=None):
+        super().__init__(path, debug, fingerprinter=fingerprinter)
+        self.bloom_path = bloom_path
+        self.patterns = [re.compile(p) for p in patterns]
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.span = ttl / generations
+        self.generations = generations
+        self.stats = stats
+        self.filters = {}
+        self.pending = set()
+        os.makedirs(bloom_path, exist_ok=True)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            job_dir(settings),
+            settings.getbool('DUPEFILTER_DEBUG'),
+            fingerprinter=crawler.request_fingerprinter,
+            bloom_path=settings.get('DUPEFILTER_BLOOM_PATH', 'data/dupefilter'),
+            patterns=settings.getlist('DUPEFILTER_BLOOM_PATTERNS', [r'/read\.php']),
+            capacity=settings.getint('DUPEFILTER_BLOOM_CAPACITY', 1000000),
+            error_rate=settings.getfloat('DUPEFILTER_BLOOM_ERROR_RATE', 0.001),
+            ttl=settings.getfloat('DUPEFILTER_BLOOM_TTL', 7 * 86400),
+            generations=settings.getint('DUPEFILTER_BLOOM_GENERATIONS', 4),
+            stats=crawler.stats,
+        )
+
+    def uses_bloom(self, request):
+        opt_in = request.meta.get('bloom_dupefilter')
+        if opt_in is not None:
+            return bool(opt_in)
+        return any(p.search(request.url) for p in self.patterns)
+
+    def request_key(self, request):
+        return request.meta.get('dupefilter_key') or self.request_fingerprint(request)
+
+    def request_seen(self, request):
+        if not self.uses_bloom(request):
+            return super().request_seen(request)
+        key = self.request_key(request)
+        if key in self.pending:
+            if self.stats is not None:
+                self.stats.inc_value('dupefilter/bloom/pending')
+            return True
+        current = self.rotate()
+        positions = None
+        for generation, bloom in sorted(self.filters.items(), reverse=True):
+            positions = positions or bloom.positions(key)
+            if bloom.contains(positions):
+                if self.stats is not None:
+                    self.stats.inc_value('dupefilter/bloom/filtered')
+                # 命中旧代的键写入当前代，持续被请求的URL不会因分代过期而被重抓
+                if generation != current:
+                    self.filters[current].add(positions)
+                return True
+        self.pending.add(key)
+        return False
+
+    def mark_seen(self, request):
+        """请求的页面已成功解析，写入当前代"""
+        if not self.uses_bloom(request):
+            return
+        key = self.request_key(request)
+        self.pending.discard(key)
+        bloom = self.filters[self.rotate()]
+        bloom.add(bloom.positions(key))
+        if self.stats is not None:
+            self.stats.inc_value('dupefilter/bloom/added')
+
+    def forget(self, request):
+        """请求最终失败，不记录，本次运行内也允许重新调度"""
+        if self.uses_bloom(request):
+            self.pending.discard(self.request_key(request))
+
+    def rotate(self, now=None):
+        """打开当前时间对应的一代，关闭并删除超出保留范围的旧代，返回当前代编号"""
+        now = time.time() if now is None else now
+        current = int(now // self.span)
+        if current in self.filters:
+            return current
+        oldest = current - self.generations + 1
+        for name in os.listdir(self.bloom_path):
+            if not name.endswith('.bloom'):
+                continue
+            generation = int(name[:-len('.bloom')])
+            if generation < oldest:
+                if generation in self.filters:
+                    self.filters.pop(generation).close()
+                os.remove(os.path.join(self.bloom_path, name))
+            elif generation not in self.filters:
+                self.filters[generation] = self.open_generation(generation)
+        if current not in self.filters:
+            self.filters[current] = self.open_generation(current)
+        return current
+
+    def open_generation(self, generation):
+        path = os.path.join(self.bloom_path, f'{generation}.bloom')
+        return BloomFilter(path, self.capacity, self.error_rate)
+
+    def close(self, reason):
+        for bloom in self.filters.values():
+            bloom.close()
+        self.filters.clear()
+        super().close(reason)
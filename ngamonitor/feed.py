@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import re
+import time
+
+from scrapy.utils.serialize import ScrapyJSONEncoder
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+logger = logging.getLogger(__name__)
+
+# 段文件名：<前缀>-<序号>-<创建时间>.jsonl，按序号排序即为写入顺序
+SEGMENT_PATTERN = re.compile(r'^(?P<prefix>.+)-(?P<seq>\d{6})-\d{14}\.jsonl$')
+# 写入方持有的锁文件，同一目录同时只允许一个写入方
+LOCK_FILE = '.lock'
+
+
+def segments(directory):
+    """目录中的段文件名，按写入顺序排列"""
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if SEGMENT_PATTERN.match(name)]
+    return sorted(names, key=segment_seq)
+
+
+def segment_seq(name):
+    return int(SEGMENT_PATTERN.match(name).group('seq'))
+
+
+def directories(directory):
+    """directory本身和其下各worker子目录（多worker模式）中有段文件的目录"""
+    if not os.path.isdir(directory):
+        return []
+    candidates = [directory] + sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if os.path.isdir(os.path.join(directory, name))
+    )
+    return [path for path in candidates if segments(path)]
+
+
+def modified_time(directory):
+    """各目录最新段文件的最近修改时间，用于判断是否有新数据；没有段文件时返回None"""
+    times = [os.path.getmtime(os.path.join(path, segments(path)[-1])) for path in directories(directory)]
+    return max(times) if times else None
+
+
+class FeedWriter:
+    """JSON Lines输出：每条记录一行，只追加写入，按大小和时间切分成多个段文件
+
+    - 打开时对目录加排他锁，已有其他进程在写同一目录时立即报错
+    - 每次打开都新建一个段文件；上次进程被强制结束时最后一个段末尾可能残留半行，打开时截掉
+    - write只写入缓冲区，sync时flush并fsync，由调用方按条数或时间批量调用
+    - 当前段超过max_bytes字节或已打开max_age秒时切换到新段
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, max_age=3600, prefix='nga'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.prefix = prefix
+        self.encoder = ScrapyJSONEncoder(ensure_ascii=False)
+        self.lock_file = None
+        self.file = None
+        self.name = None
+        self.size = 0
+        self.opened = 0
+        self.pending = 0
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock()
+        names = segments(self.directory)
+        if names:
+            self.repair(os.path.join(self.directory, names[-1]))
+        self.open_segment(segment_seq(names[-1]) + 1 if names else 0)
+
+    def lock(self):
+        path = os.path.join(self.directory, LOCK_FILE)
+        self.lock_file = open(path, 'a+b')
+        try:
+            if os.name == 'nt':
+                self.lock_file.seek(0)
+                msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lock_file.close()
+            self.lock_file = None
+            raise RuntimeError(f"输出目录{self.directory}正被其他爬虫进程写入，请等其结束或改用其他JSONL_FEED_DIR")
+
+    def unlock(self):
+        if self.lock_file is None:
+            return
+        if os.name == 'nt':
+            self.lock_file.seek(0)
+            msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        # 关闭文件即释放flock
+        self.lock_file.close()
+        self.lock_file = None
+
+    def repair(self, path):
+        """截掉最后一个换行符之后的不完整记录"""
+        with open(path, 'r+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                step = min(end, 65536)
+                f.seek(end - step)
+                block = f.read(step)
+                index = block.rfind(b'\n')
+                if index >= 0:
+                    end = end - step + index + 1
+                    break
+                end -= step
+            if end < size:
+                f.truncate(end)
+                f.flush()
+                os.fsync(f.fileno())
+                logger.warning(f"输出文件{path}末尾有不完整的记录（{size - end}字节），已截断")
+
+    def open_segment(self, seq):
+        self.name = f"{self.prefix}-{seq:06d}-{time.strftime('%Y%m%d%H%M%S')}.jsonl"
+        self.file = open(os.path.join(self.directory, self.name), 'xb')
+        self.size = 0
+        self.opened = time.time()
+        self.pending = 0
+        self.sync_directory()
+
+    def sync_directory(self):
+        """新建的文件名也要落盘（Windows不支持对目录fsync）"""
+        if os.name == 'nt':
+            return
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def write(self, record):
+        line = (self.encoder.encode(dict(record)) + '\n').encode('utf-8')
+        if self.size and (self.size + len(line) > self.max_bytes or time.time() - self.opened >= self.max_age):
+            self.rotate()
+        self.file.write(line)
+        self.size += len(line)
+        self.pending += 1
+
+    def sync(self):
+        """把已写入的记录落盘；空闲时也在这里按时间切换段"""
+        if self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+        if self.size and time.time() - self.opened >= self.max_age:
+            self.rotate()
+
+    def rotate(self):
+        self.close_segment()
+        self.open_segment(segment_seq(self.name) + 1)
+
+    def close(self):
+        self.close_segment()
+        self.unlock()
+
+    def close_segment(self):
+        if self.file is None:
+            return
+        if self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+        self.file.close()
+        self.file = None
+
+
+class FeedReader:
+    """从上次的位置继续读取FeedWriter写出的记录，只解析新增的部分
+
+    position为{'segment': 段文件名, 'offset': 字节偏移}，可以保存为JSON，下次传入即可从该处继续。
+    正在写入的最后一段末尾的半行不会被读取，等写完整后下次再读。
+    """
+
+    def __init__(self, directory, position=None):
+        self.directory = directory
+        self.position = dict(position) if position else {'segment': None, 'offset': 0}
+
+    def read(self, limit=None):
+        """返回新记录列表，最多limit条，并把position移到最后一条之后"""
+        records = []
+        names = segments(self.directory)
+        current = self.position['segment']
+        if current is not None:
+            names = [name for name in names if segment_seq(name) >= segment_seq(current)]
+        for i, name in enumerate(names):
+            if name != self.position['segment']:
+                self.position = {'segment': name, 'offset': 0}
+            last = i == len(names) - 1
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                f.seek(self.position['offset'])
+                while limit is None or len(records) < limit:
+                    line = f.readline()
+                    if not line:
+                        break
+                    if not line.endswith(b'\n'):
+                        # 最后一段可能还在写入；之前的段已不会再追加，残留的半行直接跳过
+                        if not last:
+                            logger.warning(f"跳过{name}末尾不完整的记录（{len(line)}字节）")
+                            self.position['offset'] = f.tell()
+                        break
+                    self.position['offset'] = f.tell()
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        logger.warning(f"跳过{name}中无法解析的记录（偏移{self.position['offset'] - len(line)}）")
+            if limit is not None and len(records) >= limit:
+                break
+        return records
+
+
+def iter_records(path, batch=1000):
+    """读取全部记录：path可以是FeedWriter的输出目录（含各worker子目录）、单个.jsonl文件或旧版的JSON数组文件"""
+    if os.path.isdir(path):
+        for directory in directories(path):
+            reader = FeedReader(directory)
+            while True:
+                records = reader.read(batch)
+                if not records:
+                    break
+                yield from records
+    elif path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                # 末尾没有换行符的是写了一半的记录
+                if line.endswith('\n') and line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
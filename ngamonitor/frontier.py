@@ -0,0 +1,142 @@
+import os
+import json
+import sqlite3
+import time
+
+
+class SharedFrontier:
+    """多个爬虫进程共享的帖子抓取队列与去重库（SQLite，WAL模式，可在同一台机器上多进程共用）
+
+    各worker抓取自己分片内的列表页，把需要下载正文的帖子按tid写入frontier；
+    正文请求则由任意worker以租约方式领取，租约超时（worker崩溃）后可被其他worker重新领取。
+    每次领取计一次尝试，达到max_attempts次仍未完成的帖子标记为failed，不再领取，直到回复数增加后重新入队。
+    """
+
+    def __init__(self, path, lease_timeout=600, max_attempts=3):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # isolation_level=None 手动控制事务，领取任务时用BEGIN IMMEDIATE保证多进程互斥
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS frontier ('
+            ' tid INTEGER PRIMARY KEY,'
+            ' fid INTEGER,'
+            ' item TEXT,'
+            ' start_page INTEGER,'
+            ' last_page INTEGER,'
+            ' max_floor INTEGER,'
+            ' reply_count INTEGER,'
+            ' priority INTEGER DEFAULT 0,'
+            ' status TEXT,'
+            ' worker TEXT,'
+            ' leased_at REAL,'
+            ' enqueued_at REAL,'
+            ' attempts INTEGER DEFAULT 0'
+            ')'
+        )
+        # 旧版队列库没有attempts列
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(frontier)')]
+        if 'attempts' not in columns:
+            self.conn.execute('ALTER TABLE frontier ADD COLUMN attempts INTEGER DEFAULT 0')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_frontier_status ON frontier (status, priority, enqueued_at)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS emitted ('
+            ' post_id INTEGER,'
+            ' reply_count INTEGER,'
+            ' worker TEXT,'
+            ' emitted_at REAL,'
+            ' PRIMARY KEY (post_id, reply_count)'
+            ')'
+        )
+
+    @classmethod
+    def from_settings(cls, path, settings):
+        return cls(
+            path,
+            lease_timeout=settings.getfloat('NGA_FRONTIER_LEASE_TIMEOUT', 600),
+            max_attempts=settings.getint('NGA_FRONTIER_MAX_ATTEMPTS', 3),
+        )
+
+    def push(self, item, start_page, last_page, max_floor, priority=0):
+        """写入一个待抓取帖子，返回是否入队。
+
+        已在抓取中的tid视为重复；排队中、已完成或已放弃的帖子只有回复数增加才更新/重新入队。
+        """
+        cursor = self.conn.execute(
+            'INSERT INTO frontier (tid, fid, item, start_page, last_page, max_floor, reply_count, priority, status, enqueued_at) '
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?) "
+            'ON CONFLICT(tid) DO UPDATE SET item = excluded.item, start_page = excluded.start_page, '
+            'last_page = excluded.last_page, max_floor = excluded.max_floor, reply_count = excluded.reply_count, '
+            "priority = excluded.priority, status = 'queued', worker = NULL, leased_at = NULL, enqueued_at = excluded.enqueued_at, "
+            'attempts = 0 '
+            "WHERE frontier.status IN ('queued', 'done', 'failed') AND excluded.reply_count > frontier.reply_count",
+            (item['post_id'], item.get('fid'), json.dumps(item, ensure_ascii=False), start_page, last_page,
+             max_floor, item.get('reply_count'), priority, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def lease(self, worker, limit):
+        """领取最多limit个待抓取帖子，返回[(item, start_page, last_page, max_floor, priority), ...]"""
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 租约超时且尝试次数已用完的帖子放弃
+            self.conn.execute(
+                "UPDATE frontier SET status = 'failed', worker = NULL, leased_at = NULL "
+                "WHERE status = 'leased' AND leased_at < ? AND attempts >= ?",
+                (now - self.lease_timeout, self.max_attempts)
+            )
+            rows = self.conn.execute(
+                'SELECT tid, item, start_page, last_page, max_floor, priority FROM frontier '
+                "WHERE status = 'queued' OR (status = 'leased' AND leased_at < ?) "
+                'ORDER BY priority DESC, enqueued_at LIMIT ?',
+                (now - self.lease_timeout, limit)
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE frontier SET status = 'leased', worker = ?, leased_at = ?, attempts = attempts + 1 WHERE tid = ?",
+                [(worker, now, row[0]) for row in rows]
+            )
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return [(json.loads(row[1]), row[2], row[3], row[4], row[5]) for row in rows]
+
+    def complete(self, tid):
+        self.conn.execute("UPDATE frontier SET status = 'done', leased_at = NULL WHERE tid = ?", (tid,))
+
+    def fail(self, tid):
+        """本次抓取失败：还有尝试次数时立即放回队列，否则标记为failed，返回是否放弃"""
+        self.conn.execute(
+            "UPDATE frontier SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            "worker = NULL, leased_at = NULL WHERE tid = ? AND status = 'leased'",
+            (self.max_attempts, tid)
+        )
+        row = self.conn.execute('SELECT status FROM frontier WHERE tid = ?', (tid,)).fetchone()
+        return row is not None and row[0] == 'failed'
+
+    def pending(self):
+        """尚未完成的帖子数（排队中或被任意worker领取中，不含已放弃的）"""
+        return self.conn.execute("SELECT COUNT(*) FROM frontier WHERE status IN ('queued', 'leased')").fetchone()[0]
+
+    def outstanding(self, worker):
+        """该worker领取后尚未完成的帖子数"""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM frontier WHERE status = 'leased' AND worker = ?", (worker,)
+        ).fetchone()[0]
+
+    def claim_output(self, post_id, reply_count, worker):
+        """同一帖子同一回复数只允许一个worker输出，租约超时导致的重复抓取在这里去重"""
+        cursor = self.conn.execute(
+            'INSERT OR IGNORE INTO emitted (post_id, reply_count, worker, emitted_at) VALUES (?, ?, ?, ?)',
+            (post_id, reply_count, worker, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def close(self):
+        self.conn.close()
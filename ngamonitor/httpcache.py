@@ -0,0 +1,209 @@
+import os
+import zlib
+import sqlite3
+import logging
+from time import time
+from scrapy.extensions.httpcache import RFC2616Policy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+from w3lib.url import url_query_cleaner
+
+logger = logging.getLogger(__name__)
+
+
+class NgaCachePolicy(RFC2616Policy):
+    """按URL类别区分缓存时长的HTTP缓存策略
+
+    - 列表页（thread.php）：默认不直接复用缓存，过期后带If-Modified-Since/If-None-Match重新请求，
+      服务器返回304时才使用缓存
+    - 帖子页（read.php）：已满的页面内容基本不变，缓存较长时间；最后一页由爬虫通过
+      meta['httpcache_ttl']指定较短的时长，保证新楼层能被抓到
+    - 其他页面使用默认时长
+
+    SqliteCacheStorage把写入时的meta['httpcache_ttl']随缓存保存，读取时放在meta['cache_ttl']中，
+    新鲜度以写入时的时长为准：作为最后一页缓存的页面之后再作为已满的页面请求时，仍按最后一页的时长判断，
+    不会不经重新请求就沿用7天。
+
+    NGA的响应通常不带Cache-Control/ETag，因此以上时长优先于响应头推算的新鲜度；
+    服务器提供校验头时，缓存过期后一律做条件请求。
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.list_ttl = settings.getfloat('NGA_CACHE_LIST_TTL', 0)
+        self.read_ttl = settings.getfloat('NGA_CACHE_READ_TTL', 86400)
+        self.default_ttl = settings.getfloat('NGA_CACHE_DEFAULT_TTL', 3600)
+
+    def ttl(self, request):
+        """本次请求的缓存时长，写入缓存时使用"""
+        ttl = request.meta.get('httpcache_ttl')
+        if ttl is not None:
+            return float(ttl)
+        if '/thread.php' in request.url:
+            return self.list_ttl
+        if '/read.php' in request.url:
+            return self.read_ttl
+        return self.default_ttl
+
+    def should_cache_response(self, response, request):
+        cc = self._parse_cachecontrol(response)
+        if b'no-store' in cc or response.status == 304:
+            return False
+        if self.always_store:
+            return True
+        # 时长为0的页面只有在能做条件请求时才值得缓存
+        if self.ttl(request) <= 0:
+            return response.status == 200 and (b'Last-Modified' in response.headers or b'ETag' in response.headers)
+        return response.status in (200, 203)
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        ccreq = self._parse_cachecontrol(request)
+        if b'no-cache' not in ccreq:
+            now = time()
+            ttl = request.meta.get('cache_ttl')
+            if ttl is None:
+                ttl = self.ttl(request)
+            if self._compute_current_age(cachedresponse, request, now) < ttl:
+                return True
+        # 缓存已过期，有校验头时改为条件请求
+        self._set_conditional_validators(request, cachedresponse)
+        return False
+
+
+class SqliteCacheStorage:
+    """把缓存响应保存在单个SQLite文件中的存储后端，响应体zlib压缩
+
+    替代FilesystemCacheStorage每个请求一个目录、多个小文件的结构。超过HTTPCACHE_SQLITE_MAX_BYTES时
+    按最近访问时间淘汰到上限的90%；关闭时空闲页占比超过HTTPCACHE_SQLITE_VACUUM_RATIO则VACUUM压缩文件。
+    缓存键忽略HTTPCACHE_IGNORE_QUERY_PARAMS中的参数（列表页的__timestamp每次都不同，否则永远命中不了）。
+    """
+
+    # 命中时的访问时间先记在内存里，攒够一批再写库，避免每次命中都占用写锁
+    TOUCH_BATCH = 100
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.max_bytes = settings.getint('HTTPCACHE_SQLITE_MAX_BYTES', 512 * 1024 * 1024)
+        self.level = settings.getint('HTTPCACHE_SQLITE_COMPRESSION_LEVEL', 6)
+        self.vacuum_ratio = settings.getfloat('HTTPCACHE_SQLITE_VACUUM_RATIO', 0.25)
+        self.ignore_params = settings.getlist('HTTPCACHE_IGNORE_QUERY_PARAMS', ['__timestamp'])
+        self.conn = None
+        self.total_bytes = 0
+        self.touched = {}
+
+    def open_spider(self, spider):
+        path = os.path.join(self.cachedir, f'{spider.name}.sqlite')
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' fingerprint TEXT PRIMARY KEY,'
+            ' url TEXT,'
+            ' status INTEGER,'
+            ' headers BLOB,'
+            ' body BLOB,'
+            ' size INTEGER,'
+            ' stored REAL,'
+            ' accessed REAL,'
+            ' ttl REAL'
+            ')'
+        )
+        # 兼容旧版本缓存库：补充ttl列
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(responses)')]
+        if 'ttl' not in columns:
+            self.conn.execute('ALTER TABLE responses ADD COLUMN ttl REAL')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)')
+        self.conn.commit()
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        logger.debug('Using SQLite cache storage in %(path)s', {'path': path}, extra={'spider': spider})
+
+    def close_spider(self, spider):
+        self.flush_touched()
+        self.compact()
+        self.conn.close()
+
+    def request_key(self, request):
+        if self.ignore_params:
+            url = url_query_cleaner(request.url, self.ignore_params, remove=True, unique=False, keep_fragments=True)
+            if url != request.url:
+                request = request.replace(url=url)
+        return self._fingerprinter.fingerprint(request).hex()
+
+    def retrieve_response(self, spider, request):
+        key = self.request_key(request)
+        row = self.conn.execute(
+            'SELECT url, status, headers, body, stored, ttl FROM responses WHERE fingerprint = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, stored, ttl = row
+        if 0 < self.expiration_secs < time() - stored:
+            return None
+        self.touched[key] = time()
+        if len(self.touched) >= self.TOUCH_BATCH:
+            self.flush_touched()
+        request.meta['cache_timestamp'] = stored
+        # 写入时指定的缓存时长（如帖子最后一页），优先于本次请求按URL推算的时长
+        if ttl is not None:
+            request.meta['cache_ttl'] = ttl
+        else:
+            request.meta.pop('cache_ttl', None)
+        headers = Headers(headers_raw_to_dict(headers))
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        key = self.request_key(request)
+        headers = headers_dict_to_raw(response.headers)
+        body = zlib.compress(response.body, self.level)
+        size = len(headers) + len(body)
+        now = time()
+        ttl = request.meta.get('httpcache_ttl')
+        old = self.conn.execute('SELECT size FROM responses WHERE fingerprint = ?', (key,)).fetchone()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO responses (fingerprint, url, status, headers, body, size, stored, accessed, ttl) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, response.url, response.status, headers, body, size, now, now, float(ttl) if ttl is not None else None)
+        )
+        self.conn.commit()
+        self.total_bytes += size - (old[0] if old else 0)
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            self.evict(int(self.max_bytes * 0.9))
+
+    def flush_touched(self):
+        if not self.touched:
+            return
+        self.conn.executemany(
+            'UPDATE responses SET accessed = ? WHERE fingerprint = ?',
+            [(accessed, key) for key, accessed in self.touched.items()]
+        )
+        self.conn.commit()
+        self.touched.clear()
+
+    def evict(self, target_bytes):
+        """按最近访问时间从旧到新删除，直到总大小不超过target_bytes"""
+        self.flush_touched()
+        removed = []
+        for key, size in self.conn.execute('SELECT fingerprint, size FROM responses ORDER BY accessed'):
+            if self.total_bytes <= target_bytes:
+                break
+            removed.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany('DELETE FROM responses WHERE fingerprint = ?', removed)
+        self.conn.commit()
+        return len(removed)
+
+    def compact(self, force=False):
+        """空闲页占比超过阈值时VACUUM，回收淘汰和覆盖留下的空间"""
+        page_count = self.conn.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = self.conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if force or (page_count and free_pages / page_count > self.vacuum_ratio):
+            self.conn.execute('VACUUM')
+            return True
+        return False
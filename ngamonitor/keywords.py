@@ -0,0 +1,112 @@
+import os
+import time
+from collections import deque
+
+
+class KeywordMatcher:
+    """Aho-Corasick多模式匹配，一次扫描找出文本中所有关键词（不区分大小写）
+
+    耗时只与文本长度和命中数有关，与关键词数量无关。大小写不同的同一个词（如'bug'和'BUG'）
+    共用一个模式，命中时各自计数，与逐个关键词比较的旧实现结果一致。
+    """
+
+    def __init__(self, keywords):
+        self.keywords = [k for k in dict.fromkeys(keywords) if k]
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        patterns = {}
+        for keyword in self.keywords:
+            patterns.setdefault(keyword.lower(), []).append(keyword)
+        self.patterns = list(patterns.items())
+        for index, (pattern, _) in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = nxt
+            self.output[state] = self.output[state] + (index,)
+        # 广度优先计算失败指针，并把失败链上的输出合并到当前状态
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def finditer(self, text):
+        """逐个产出(起始位置, 模式序号)"""
+        goto, fail, output, patterns = self.goto, self.fail, self.output, self.patterns
+        root = goto[0]
+        state = 0
+        for i, ch in enumerate(text.lower()):
+            if state == 0 and ch not in root:
+                continue
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in output[state]:
+                yield i - len(patterns[index][0]) + 1, index
+
+    def scan(self, text):
+        """返回{关键词: [起始位置, ...]}，只包含命中的关键词"""
+        hits = {}
+        for start, index in self.finditer(text):
+            for keyword in self.patterns[index][1]:
+                hits.setdefault(keyword, []).append(start)
+        return hits
+
+    def count_distinct(self, text):
+        """命中的不同关键词个数"""
+        return len(self.scan(text)) if text else 0
+
+
+class KeywordSet:
+    """从关键词文件加载并在文件变化时自动重建匹配器（热更新）
+
+    文件每行一个关键词，#开头为注释；文件不存在时使用默认关键词。
+    为避免每条数据都stat文件，最多每check_interval秒检查一次修改时间。
+    """
+
+    def __init__(self, path=None, defaults=(), check_interval=5):
+        self.path = path
+        self.defaults = list(defaults)
+        self.check_interval = check_interval
+        self.mtime = None
+        self.checked = 0
+        self.current = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.get('RISK_KEYWORDS_FILE'),
+            settings.getlist('RISK_KEYWORDS'),
+            settings.getfloat('RISK_KEYWORDS_RELOAD_INTERVAL', 5),
+        )
+
+    def matcher(self):
+        now = time.monotonic()
+        if self.current is not None and now - self.checked < self.check_interval:
+            return self.current
+        self.checked = now
+        mtime = os.path.getmtime(self.path) if self.path and os.path.exists(self.path) else None
+        if self.current is None or mtime != self.mtime:
+            self.mtime = mtime
+            self.current = KeywordMatcher(self.load())
+        return self.current
+
+    def load(self):
+        if self.mtime is None:
+            return self.defaults
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
@@ -11,6 +11,13 @@ from itemadapter import ItemAdapter
 from urllib.parse import urlencode
 import random
 import os
+import time
+
+from twisted.internet.task import deferLater
+from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.httpobj import urlparse_cached
 
         
 class NgaMonitorSpiderMiddleware:
@@ -119,4 +126,325 @@ class CustomHeadersMiddleware:
             'Sec-Fetch-Mode': 'navigate',
             'Sec-Fetch-Site': 'same-origin',
             'Sec-Fetch-User': '?1'
-        })
\ No newline at end of file
+        })
+
+def parse_cookie_string(cookie_str):
+    """把浏览器复制的cookie字符串解析为字典"""
+    return {kv.split('=')[0].strip(): kv.split('=')[1].strip() for kv in cookie_str.split(';') if '=' in kv}
+
+
+class TokenBucket:
+    """令牌桶：每秒补充rate个令牌，最多积攒burst个"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """距离下一个令牌可用还需等待的秒数"""
+        self.refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def reserve(self, now):
+        """预订一个令牌，令牌不足时允许透支，返回需要等待的秒数"""
+        wait = self.wait_time(now)
+        self.tokens -= 1
+        return wait
+
+
+class Session:
+    def __init__(self, name, cookies, rate, burst):
+        self.name = name
+        self.cookies = cookies
+        self.bucket = TokenBucket(rate, burst)
+        self.alive = True
+        self.inflight = 0
+
+
+# 多账号会话池
+class SessionPoolMiddleware:
+    """把请求分配到多个Cookie会话上，每个会话独立的cookiejar、下载槽和令牌桶
+
+    会话来自NGA_SESSIONS（cookie字符串列表）和NGA_SESSIONS_FILE（每行一个cookie字符串），
+    都未配置时不生效，沿用爬虫自身的cookie。每个会话使用独立的download_slot，
+    DOWNLOAD_DELAY按会话分别计算，总吞吐随会话数增长。
+    需排在RedirectMiddleware(600)之后、CookiesMiddleware(700)之前：被重定向到login.php或返回403的会话
+    视为失效，本次运行内不再使用，请求换一个会话重发。HttpCacheMiddleware需排在它之前，
+    命中缓存的请求不经过这里，不消耗令牌。
+    """
+
+    def __init__(self, cookie_strings, rate=0.2, burst=3, stats=None):
+        self.sessions = []
+        for index, cookie_str in enumerate(cookie_strings):
+            cookies = parse_cookie_string(cookie_str)
+            name = f"s{index}-{cookies.get('ngaPassportUid', '')}"
+            self.sessions.append(Session(name, cookies, rate, burst))
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        cookie_strings = [c for c in settings.getlist('NGA_SESSIONS') if c.strip()]
+        path = settings.get('NGA_SESSIONS_FILE')
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                cookie_strings += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        return cls(
+            cookie_strings,
+            rate=settings.getfloat('NGA_SESSION_RATE', 0.2),
+            burst=settings.getfloat('NGA_SESSION_BURST', 3),
+            stats=crawler.stats,
+        )
+
+    def pick(self, now):
+        alive = [s for s in self.sessions if s.alive]
+        if not alive:
+            return None
+        return min(alive, key=lambda s: (s.bucket.wait_time(now), s.inflight))
+
+    async def process_request(self, request, spider):
+        if not self.sessions:
+            return None
+        now = time.monotonic()
+        # 重试、重定向的请求沿用原会话，原会话已失效时重新分配
+        session = self.session_of(request)
+        if session is None or not session.alive:
+            session = self.pick(now)
+            if session is None:
+                return None
+            request.meta['session'] = session.name
+            request.meta['cookiejar'] = session.name
+            request.meta['download_slot'] = f'{urlparse_cached(request).hostname}#{session.name}'
+            request.cookies = dict(session.cookies)
+        session.inflight += 1
+        self.stats.inc_value(f'nga/session/{session.name}/requests')
+        wait = session.bucket.reserve(now)
+        if wait > 0:
+            # 令牌不足时异步等待，不阻塞其他会话的请求
+            self.stats.inc_value('nga/session/throttled')
+            from twisted.internet import reactor
+            await maybe_deferred_to_future(deferLater(reactor, wait, lambda: None))
+        return None
+
+    def process_response(self, request, response, spider):
+        session = self.session_of(request)
+        if session is None:
+            return response
+        session.inflight -= 1
+        location = response.headers.get('Location', b'').decode('latin-1')
+        if response.status == 403 or 'login.php' in response.url or 'login.php' in location:
+            return self.retire(session, request, response, spider, f'HTTP {response.status} {location or response.url}')
+        return response
+
+    def process_exception(self, request, exception, spider):
+        session = self.session_of(request)
+        if session is not None:
+            session.inflight -= 1
+        return None
+
+    def session_of(self, request):
+        name = request.meta.get('session')
+        for session in self.sessions:
+            if session.name == name:
+                return session
+        return None
+
+    def retire(self, session, request, response, spider, reason):
+        if session.alive:
+            session.alive = False
+            self.stats.inc_value('nga/session/retired')
+            spider.logger.warning(f"会话{session.name}失效（{reason}），剩余可用会话 {sum(s.alive for s in self.sessions)} 个")
+        if not any(s.alive for s in self.sessions):
+            spider.logger.error("所有会话均已失效，请更新cookie")
+            return response
+        # 换一个会话重发，位于重定向中间件之前，拿到的仍是跳转到登录页之前的请求
+        retry = request.replace(dont_filter=True)
+        for key in ('session', 'cookiejar', 'download_slot'):
+            retry.meta.pop(key, None)
+        return retry
+
+
+class EndpointThrottle:
+    def __init__(self, delay, concurrency):
+        self.delay = delay
+        self.concurrency = concurrency
+        self.healthy = 0
+
+
+# 按接口反馈调整请求间隔和并发
+class AdaptiveThrottleMiddleware:
+    """按(下载槽, 接口)分别维护请求间隔和并发，替代只看延迟的AutoThrottle
+
+    - 403/429/5xx、跳转登录页、下载异常：间隔乘以NGA_THROTTLE_BACKOFF，并发减半
+    - 响应正常：间隔乘以NGA_THROTTLE_DECREASE逐步缩短；连续NGA_THROTTLE_HEALTHY_STREAK次正常后并发加一
+    - 响应正常但下载耗时超过NGA_THROTTLE_TARGET_LATENCY：间隔小幅增加
+    当前间隔和并发写入统计 nga/throttle/<槽>/delay、nga/throttle/<槽>/concurrency。
+    需排在RedirectMiddleware(600)之后才能看到跳转登录页的302。
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.start_delay = settings.getfloat('NGA_THROTTLE_START_DELAY', settings.getfloat('DOWNLOAD_DELAY'))
+        self.min_delay = settings.getfloat('NGA_THROTTLE_MIN_DELAY', 1.0)
+        self.max_delay = settings.getfloat('NGA_THROTTLE_MAX_DELAY', 60.0)
+        self.backoff = settings.getfloat('NGA_THROTTLE_BACKOFF', 2.0)
+        self.decrease = settings.getfloat('NGA_THROTTLE_DECREASE', 0.9)
+        self.target_latency = settings.getfloat('NGA_THROTTLE_TARGET_LATENCY', 5.0)
+        self.max_concurrency = settings.getint('NGA_THROTTLE_MAX_CONCURRENCY', 2)
+        self.healthy_streak = settings.getint('NGA_THROTTLE_HEALTHY_STREAK', 10)
+        self.states = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def slot_key(self, request):
+        # 已经加过接口后缀的槽（重试、重定向）直接沿用
+        slot = request.meta.get('download_slot')
+        if slot is not None and slot == request.meta.get('throttle_slot'):
+            return slot
+        base = slot or urlparse_cached(request).hostname or ''
+        endpoint = urlparse_cached(request).path.rsplit('/', 1)[-1] or '/'
+        return f'{base}/{endpoint}'
+
+    def process_request(self, request, spider):
+        key = self.slot_key(request)
+        request.meta['download_slot'] = key
+        request.meta['throttle_slot'] = key
+        if key not in self.states:
+            self.states[key] = EndpointThrottle(self.start_delay, 1)
+        self.apply(key)
+        return None
+
+    def process_response(self, request, response, spider):
+        key = request.meta.get('throttle_slot')
+        # 缓存命中的响应没有经过下载器
+        if key not in self.states or 'cached' in response.flags:
+            return response
+        location = response.headers.get('Location', b'').decode('latin-1')
+        if response.status in (403, 429) or response.status >= 500 or 'login.php' in location or 'login.php' in response.url:
+            self.penalize(key, f'HTTP {response.status}')
+        elif response.status < 400:
+            latency = request.meta.get('download_latency')
+            if latency is not None and latency > self.target_latency:
+                state = self.states[key]
+                state.delay = min(self.max_delay, state.delay * 1.25)
+                state.healthy = 0
+            else:
+                self.reward(key)
+        self.apply(key)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        key = request.meta.get('throttle_slot')
+        if key in self.states:
+            self.penalize(key, type(exception).__name__)
+            self.apply(key)
+        return None
+
+    def penalize(self, key, reason):
+        state = self.states[key]
+        state.delay = min(self.max_delay, max(state.delay * self.backoff, self.min_delay))
+        state.concurrency = max(1, state.concurrency // 2)
+        state.healthy = 0
+        self.crawler.stats.inc_value('nga/throttle/backoff')
+        self.crawler.spider.logger.info(f"{key} 触发限流（{reason}），请求间隔调整为{state.delay:.1f}秒")
+
+    def reward(self, key):
+        state = self.states[key]
+        state.delay = max(self.min_delay, state.delay * self.decrease)
+        state.healthy += 1
+        if state.healthy >= self.healthy_streak:
+            state.concurrency = min(self.max_concurrency, state.concurrency + 1)
+            state.healthy = 0
+
+    def apply(self, key):
+        state = self.states[key]
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None:
+            slot.delay = state.delay
+            slot.concurrency = state.concurrency
+        self.crawler.stats.set_value(f'nga/throttle/{key}/delay', round(state.delay, 2))
+        self.crawler.stats.set_value(f'nga/throttle/{key}/concurrency', state.concurrency)
+
+
+class RetryScheduled(IgnoreRequest):
+    """请求已安排在退避后重试，本次请求不再继续处理"""
+
+
+# 统一的退避重试
+class BackoffRetryMiddleware(RetryMiddleware):
+    """替代RetryMiddleware和爬虫errback中的立即重试
+
+    - 第n次重试在 RETRY_BACKOFF_BASE * 2^(n-1) 秒（不超过RETRY_BACKOFF_MAX）后发出，并加入随机抖动，
+      等待期间不占用下载并发
+    - 重试预算：累计重试数不超过 RETRY_BUDGET_RATIO * 原始请求数 + RETRY_BUDGET_MIN，
+      NGA整体故障时不会形成重试风暴
+    - 原请求以RetryScheduled结束，errback据此区分“已安排重试”和“最终失败”
+    统计：retry/count、retry/reason_count/<原因>、retry/scheduled、retry/budget_exhausted/<原因>。
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.backoff_base = settings.getfloat('RETRY_BACKOFF_BASE', 2.0)
+        self.backoff_max = settings.getfloat('RETRY_BACKOFF_MAX', 120.0)
+        self.budget_ratio = settings.getfloat('RETRY_BUDGET_RATIO', 0.2)
+        self.budget_min = settings.getint('RETRY_BUDGET_MIN', 10)
+        self.requests = 0
+        self.retries = 0
+        self.pending = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        o = super().from_crawler(crawler)
+        crawler.signals.connect(o.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def process_request(self, request, spider):
+        if not request.meta.get('retry_times'):
+            self.requests += 1
+        return None
+
+    def _retry(self, request, reason):
+        stats = self.crawler.stats
+        if self.retries >= self.budget_ratio * self.requests + self.budget_min:
+            reason_key = reason if isinstance(reason, str) else getattr(reason, '__name__', type(reason).__name__)
+            stats.inc_value(f'retry/budget_exhausted/{reason_key}')
+            self.crawler.spider.logger.warning(f"重试预算已用尽，放弃重试: {request.url}（{reason_key}）")
+            return None
+        retryreq = super()._retry(request, reason)
+        if retryreq is None:
+            return None
+        self.retries += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (retryreq.meta['retry_times'] - 1))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        from twisted.internet import reactor
+        call = reactor.callLater(delay, self.schedule, retryreq)
+        self.pending.add(call)
+        retryreq.meta['retry_call'] = call
+        stats.inc_value('retry/scheduled')
+        stats.max_value('retry/max_backoff', round(delay, 1))
+        raise RetryScheduled(f"{delay:.1f}秒后第{retryreq.meta['retry_times']}次重试")
+
+    def schedule(self, request):
+        self.pending.discard(request.meta.pop('retry_call', None))
+        self.crawler.engine.crawl(request)
+
+    def spider_idle(self, spider):
+        # 还有等待中的重试时不关闭爬虫
+        if self.pending:
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        for call in self.pending:
+            if call.active():
+                call.cancel()
+        self.pending.clear()
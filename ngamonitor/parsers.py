@@ -0,0 +1,208 @@
+import json
+import html
+import re
+from datetime import datetime
+from lxml import etree
+
+BR_RE = re.compile(r'<br\s*/?>', re.I)
+POST_TIME_RE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}')
+
+# 一次扫描文档，按文档顺序同时取出楼层节点（div[id^=post]、div.reply、NGA实际使用的tr#post1strowN）
+# 和楼层内的字段节点；class先用contains粗筛，精确的class匹配在Python侧完成
+DOCUMENT_NODES = etree.XPath(
+    "descendant-or-self::*["
+    "(self::div and (starts-with(@id, 'post') or contains(@class, 'reply')))"
+    " or (self::tr and starts-with(@id, 'post1strow'))"
+    " or contains(@class, 'postcontent') or contains(@class, 'author')"
+    " or (self::span and (contains(@class, 'floor') or contains(@class, 'postInfo') or starts-with(@id, 'postdate')))"
+    "]"
+)
+TEXT_NODES = etree.XPath('descendant-or-self::text()')
+OWN_TEXT_NODES = etree.XPath('text()')
+
+
+def load_read_json(text):
+    """解析read.php?__output=11的响应体，不是JSON或缺少楼层数据时返回None"""
+    text = text.lstrip()
+    if not text.startswith('{'):
+        return None
+    try:
+        data = json.loads(text, strict=False)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get('data'), dict) or '__R' not in data['data']:
+        return None
+    return data['data']
+
+
+def parse_read_json(data, post_id):
+    """从read.php的JSON数据中提取主楼内容和回帖，返回(content, comments)
+
+    content 为 None 表示本页不包含主楼（增量翻页的后续页）。
+    """
+    users = data.get('__U') or {}
+    rows = data.get('__R') or {}
+    if isinstance(rows, dict):
+        rows = [rows[key] for key in sorted(rows, key=lambda k: int(k) if str(k).isdigit() else 0)]
+
+    content = None
+    comments = []
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        text = json_content(row.get('content'))
+        floor = row.get('lou')
+        if floor == 0:
+            content = text
+            continue
+        if not text:
+            continue
+        user = users.get(str(row.get('authorid'))) or {}
+        comments.append({
+            'post_id': post_id,
+            'author': user.get('username'),
+            'content': text,
+            'floor': str(floor) if floor is not None else '',
+            'post_time': json_post_time(row)
+        })
+    return content, comments
+
+
+def json_content(content):
+    # 与HTML解析一致：保留BBCode原文，去掉换行标签并还原实体
+    if content is None:
+        return ''
+    return html.unescape(BR_RE.sub('', str(content))).strip()
+
+
+def json_post_time(row):
+    timestamp = row.get('postdatetimestamp')
+    if timestamp:
+        return datetime.fromtimestamp(int(timestamp)).strftime('%Y-%m-%d %H:%M')
+    postdate = row.get('postdate')
+    if isinstance(postdate, str):
+        match = re.search(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}', postdate)
+        return match.group(0) if match else None
+    return None
+
+
+def extract_html_comments(root, post_id):
+    """单次扫描文档提取回帖，结果与逐楼层CSS查询的旧实现一致
+
+    root 为 response.selector.root（lxml元素）。字段节点沿祖先链归入所在楼层，
+    总开销与文档节点数线性相关，不再随楼层数平方增长。
+    """
+    floors = {}
+    primary, replies, rows = [], [], []
+    for node in DOCUMENT_NODES(root):
+        classes = (node.get('class') or '').split()
+        node_id = node.get('id') or ''
+        if node.tag == 'div' and (node_id.startswith('post') or 'reply' in classes):
+            floors[node] = FloorFields()
+            if node_id.startswith('post'):
+                primary.append(node)
+            if 'reply' in classes:
+                replies.append(node)
+        elif node.tag == 'tr' and node_id.startswith('post1strow'):
+            floors[node] = FloorFields()
+            rows.append(node)
+
+        if 'postcontent' in classes:
+            # 外层已有postcontent时，外层之上的楼层已通过外层取到这段文本（与XPath节点集去重一致）
+            covered = False
+            for ancestor in chain_to_root(node):
+                if not covered and ancestor in floors:
+                    floors[ancestor].contents.append(node)
+                if ancestor is not node and 'postcontent' in (ancestor.get('class') or '').split():
+                    covered = True
+        if 'author' in classes or node.tag == 'span':
+            if node in floors:
+                floors[node].add(node, classes, node_id)
+            # 楼层节点只可能是div或tr，按标签过滤祖先链可省去大部分节点包装开销
+            for ancestor in node.iterancestors('div', 'tr'):
+                if ancestor in floors:
+                    floors[ancestor].add(node, classes, node_id)
+
+    comments = []
+    # 1. div[id^="post"]：跳过id=post1和第一个楼层（主楼）
+    for index, node in enumerate(primary):
+        if index == 0 or node.get('id') == 'post1':
+            continue
+        comment = floors[node].comment(post_id)
+        if comment is not None:
+            comments.append(comment)
+    # 2. 上面没采到时尝试div.reply/postbox.reply
+    if not comments:
+        for node in replies:
+            comment = floors[node].comment(post_id)
+            if comment is not None:
+                comments.append(comment)
+    # 3. NGA当前页面：楼层为tr#post1strowN，楼层号和时间取自行id与postdateN
+    if not comments:
+        for node in rows:
+            floor = node.get('id')[len('post1strow'):]
+            if floor == '0':
+                continue
+            comment = floors[node].comment(post_id, floor)
+            if comment is not None:
+                comments.append(comment)
+    return comments
+
+
+def chain_to_root(node):
+    yield node
+    yield from node.iterancestors()
+
+
+class FloorFields:
+    """单个楼层内按文档顺序收集到的字段节点"""
+
+    def __init__(self):
+        self.contents = []
+        self.author = None
+        self.generic_author = None
+        self.floor_num = None
+        self.post_time = None
+        self.postdate = None
+
+    def add(self, node, classes, node_id):
+        if 'author' in classes:
+            if self.author is None and node.tag == 'a':
+                self.author = first_own_text(node)
+            if self.generic_author is None:
+                self.generic_author = first_own_text(node)
+        if node.tag == 'span':
+            if self.floor_num is None and 'floor' in classes:
+                self.floor_num = first_own_text(node)
+            if self.post_time is None and 'postInfo' in classes:
+                for text in OWN_TEXT_NODES(node):
+                    match = POST_TIME_RE.search(text)
+                    if match:
+                        self.post_time = match.group(0)
+                        break
+            if self.postdate is None and node_id.startswith('postdate'):
+                self.postdate = first_own_text(node)
+
+    def comment(self, post_id, row_floor=None):
+        content = ''.join(text for node in self.contents for text in TEXT_NODES(node)).strip()
+        if not content:
+            return None
+        floor_num = self.floor_num
+        post_time = self.post_time
+        if row_floor is not None:
+            floor_num = floor_num or row_floor
+            if post_time is None and self.postdate:
+                match = POST_TIME_RE.search(self.postdate)
+                post_time = match.group(0) if match else None
+        return {
+            'post_id': post_id,
+            'author': self.author or self.generic_author,
+            'content': content,
+            'floor': floor_num.replace('#', '') if floor_num else '',
+            'post_time': post_time
+        }
+
+
+def first_own_text(el):
+    texts = OWN_TEXT_NODES(el)
+    return str(texts[0]) if texts else None
@@ -1,48 +1,269 @@
-import json
-import re
-from snownlp import SnowNLP
+import os
+from scrapy.exceptions import DropItem
+from ngamonitor.alerts import AlertDispatcher
+from ngamonitor.feed import FeedWriter
+from ngamonitor.keywords import KeywordSet
+from ngamonitor.sentiment import SentimentAnalyzer
+from ngamonitor.storage import PostStore
+
+
+class FrontierDedupPipeline:
+    """多worker共享队列模式下按(post_id, reply_count)去重，租约超时被重复抓取的帖子只输出一次
+
+    轻量模式的列表页条目不经过共享队列，不参与去重，也不占用之后同一回复数的正文条目。
+    """
+
+    def process_item(self, item, spider):
+        frontier = getattr(spider, 'frontier', None)
+        if frontier is None or item.get('lite'):
+            return item
+        if not frontier.claim_output(item['post_id'], item.get('reply_count'), spider.worker):
+            raise DropItem(f"重复帖子: {item['post_id']}")
+        return item
+
+
+class SqliteStoragePipeline:
+    """把帖子和回帖写入SQLite（WAL模式），攒够一批或每隔flush_interval秒在一个事务中批量写入
+
+    爬虫运行期间GUI和导出脚本即可查询最新数据，不必等输出文件在爬虫结束时写完。
+    """
+
+    def __init__(self, path, batch_size=50, flush_interval=5, negative_threshold=0.3, stats=None):
+        self.path = path
+        self.stats = stats
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.negative_threshold = negative_threshold
+        self.store = None
+        self.buffer = []
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            settings.get('SQLITE_STORAGE_PATH', 'data/nga.db'),
+            settings.getint('SQLITE_STORAGE_BATCH', 50),
+            settings.getfloat('SQLITE_STORAGE_FLUSH_INTERVAL', 5),
+            settings.getfloat('ALERT_SENTIMENT_THRESHOLD', 0.3),
+            crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        from twisted.internet.task import LoopingCall
+        self.store = PostStore(self.path, self.negative_threshold)
+        # 常驻模式下条目稀疏，定时写入保证数据及时可见
+        self.loop = LoopingCall(self.flush)
+        self.loop.start(self.flush_interval, now=False)
+
+    def close_spider(self, spider):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+        self.flush()
+        self.store.close()
+
+    def process_item(self, item, spider):
+        self.buffer.append(item)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        return item
+
+    def flush(self):
+        if not self.buffer:
+            return
+        items, self.buffer = self.buffer, []
+        self.store.write(items)
+        if self.stats is not None:
+            self.stats.inc_value('sqlite/items', len(items))
+            self.stats.inc_value('sqlite/transactions')
+
+
+class JsonLinesFeedPipeline:
+    """把条目逐行追加到JSON Lines输出（代替-o output.json），攒够sync_items条或每隔sync_interval秒fsync一次
+
+    爬虫被信号或强制结束时最多丢失最后一个未落盘批次，已写入的记录仍然完整可读；
+    输出按大小和时间切分成多个段文件，读取方用ngamonitor.feed.FeedReader从上次的位置继续读。
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, max_age=3600, sync_items=50, sync_interval=5, stats=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.sync_items = sync_items
+        self.sync_interval = sync_interval
+        self.stats = stats
+        self.writer = None
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            settings.get('JSONL_FEED_DIR', 'data/feed'),
+            settings.getint('JSONL_FEED_MAX_BYTES', 64 * 1024 * 1024),
+            settings.getfloat('JSONL_FEED_ROTATE_INTERVAL', 3600),
+            settings.getint('JSONL_FEED_SYNC_ITEMS', 50),
+            settings.getfloat('JSONL_FEED_SYNC_INTERVAL', 5),
+            crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        from twisted.internet.task import LoopingCall
+        directory = self.directory
+        # 多worker模式下各worker写各自的子目录，每个目录只有一个写入方
+        if getattr(spider, 'frontier', None) is not None:
+            directory = os.path.join(directory, spider.worker)
+        self.writer = FeedWriter(directory, self.max_bytes, self.max_age)
+        self.writer.open()
+        self.loop = LoopingCall(self.sync)
+        self.loop.start(self.sync_interval, now=False)
+
+    def close_spider(self, spider):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+        self.writer.close()
+
+    def process_item(self, item, spider):
+        self.writer.write(item)
+        if self.stats is not None:
+            self.stats.inc_value('feed/items')
+        if self.writer.pending >= self.sync_items:
+            self.sync()
+        return item
+
+    def sync(self):
+        segment = self.writer.name
+        self.writer.sync()
+        if self.stats is not None:
+            self.stats.inc_value('feed/syncs')
+            if self.writer.name != segment:
+                self.stats.inc_value('feed/rotations')
+
 
 class NgaMonitorPipeline:
-    # 风险关键词库（需动态更新）
+    # 风险关键词库默认值，实际以settings中的RISK_KEYWORDS为准
     RISK_KEYWORDS = [
         'bug', '国服', '雷火', '退款', '封号', '客服', '垃圾', '运营', 'BUG'
     ]
-    
+
+    def __init__(self, keywords=None, analyzer=None, dispatcher=None):
+        self.keywords = keywords or KeywordSet(defaults=self.RISK_KEYWORDS)
+        self.analyzer = analyzer or SentimentAnalyzer()
+        # 未配置ALERT_WEBHOOK_URL时为None，预警只写日志
+        self.dispatcher = dispatcher
+        # 预警阈值默认值，实际以settings中的ALERT_*为准
+        self.sentiment_threshold = 0.3
+        self.risk_level = 2
+        self.min_comments = 5
+        self.negative_ratio = 0.5
+        self.risk_density = 1.0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # RISK_KEYWORDS_FILE存在时以文件为准，修改后自动生效；SENTIMENT_WORKERS>0时情感分析在进程池中执行
+        settings = crawler.settings
+        pipeline = cls(
+            KeywordSet.from_settings(settings),
+            SentimentAnalyzer.from_crawler(crawler),
+            AlertDispatcher.from_crawler(crawler),
+        )
+        pipeline.sentiment_threshold = settings.getfloat('ALERT_SENTIMENT_THRESHOLD', 0.3)
+        pipeline.risk_level = settings.getint('ALERT_RISK_LEVEL', 2)
+        pipeline.min_comments = settings.getint('ALERT_MIN_COMMENTS', 5)
+        pipeline.negative_ratio = settings.getfloat('ALERT_NEGATIVE_RATIO', 0.5)
+        pipeline.risk_density = settings.getfloat('ALERT_RISK_DENSITY', 1.0)
+        return pipeline
+
+    def open_spider(self, spider):
+        self.analyzer.open()
+        if self.dispatcher is not None:
+            self.dispatcher.start()
+
+    def close_spider(self, spider):
+        self.analyzer.close()
+        if self.dispatcher is not None:
+            # 返回Deferred，队列中剩余的预警发送完再关闭
+            return self.dispatcher.close()
+
     def process_item(self, item, spider):
-        if 'content' in item and item['content']:
-            content = item['content']
-            try:
-                # 处理长文本的分块分析
-                if len(content) > 500:
-                    chunks = [content[i:i+500] for i in range(0, len(content), 500)]
-                    sentiments = [SnowNLP(chunk).sentiments for chunk in chunks if chunk.strip()]
-                    if sentiments:
-                        item['sentiment'] = sum(sentiments) / len(sentiments)
-                    else:
-                        item['sentiment'] = 0.5
-                else:
-                    item['sentiment'] = SnowNLP(content).sentiments
-            except Exception as e:
-                spider.logger.error(f"情感分析失败: {str(e)}")
-                item['sentiment'] = 0.5
-        # 风险关键词匹配和标记
-        item['risk_level'] = 0
-        item['risk_keywords'] = []
-        if 'content' in item and item['content']:
-            content = item['content']
-            for keyword in self.RISK_KEYWORDS:
-                if keyword.lower() in content.lower():
-                    item['risk_level'] += 1
-                    item['risk_keywords'].append(keyword)
-                    
-        # 高风险内容即时预警
-        if item['sentiment'] < 0.3 or item['risk_level'] >= 2:
-            self.send_alert(item)
+        # 主楼和所有回帖作为一批交给分析器（缓存、分块去重、进程池都按批处理），返回Deferred
+        documents = []
+        if item.get('content'):
+            documents.append(item['content'])
+        comments = [comment for comment in item.get('comments') or [] if comment.get('content')]
+        documents += [comment['content'] for comment in comments]
+        if not documents:
+            return self.finish_item(item, spider, [], [])
+        d = self.analyzer.analyze(documents)
+        d.addCallback(lambda results: self.finish_item(item, spider, comments, results))
+        return d
+
+    def finish_item(self, item, spider, comments, results):
+        values = []
+        for (sentiment, error) in results:
+            if error is not None:
+                spider.logger.error(f"情感分析失败: {error}")
+                sentiment = 0.5
+            values.append(sentiment)
+        if item.get('content'):
+            item['sentiment'] = values.pop(0)
+        for comment, sentiment in zip(comments, values):
+            comment['sentiment'] = sentiment
+
+        # 风险关键词匹配和标记：标题、正文和每条回帖分别扫描后汇总
+        matcher = self.keywords.matcher()
+        hits = {}
+        for text in (item.get('title'), item.get('content')):
+            for keyword, positions in matcher.scan(text or '').items():
+                hits[keyword] = hits.get(keyword, 0) + len(positions)
+        # 主楼（标题和正文）的风险等级单独计算，回帖命中只参与按回帖整体的判断
+        post_risk_level = len(hits)
+        comment_hits = 0
+        for comment in item.get('comments') or []:
+            found = matcher.scan(comment.get('content') or '')
+            comment['risk_keywords'] = list(found)
+            comment['risk_hit_count'] = sum(len(positions) for positions in found.values())
+            for keyword, positions in found.items():
+                hits[keyword] = hits.get(keyword, 0) + len(positions)
+                comment_hits += len(positions)
+        item['risk_keywords'] = list(hits)
+        item['risk_level'] = len(hits)
+        item['risk_hits'] = hits
+        self.aggregate_comments(item, values, comment_hits)
+
+        # 高风险内容即时预警（增量翻页的条目没有主楼内容，只按新增回帖判断）
+        if self.should_alert(item, post_risk_level):
+            self.send_alert(item, spider)
         return item
 
-    def send_alert(self, item):
-        """通过企业微信机器人发送警报"""
-        alert_msg = f"⚠️ NGA高风险内容告警\n标题：{item['title']}\n情感值：{item['sentiment']:.2f}\n关键词命中：{item['risk_level']}次\n链接：{item['url']}"
-        # 实际使用时替换为你的机器人Webhook
-        # requests.post("https://qyapi.weixin.qq.com/robot/send?key=YOUR_KEY", 
-        #              json={"msgtype": "text", "text": {"content": alert_msg}})
\ No newline at end of file
+    def aggregate_comments(self, item, sentiments, comment_hits):
+        """帖子级回帖汇总：情感均值、最小值、负面楼层占比、平均每楼关键词命中次数"""
+        count = len(item.get('comments') or [])
+        item['comment_count'] = count
+        item['comment_sentiment_mean'] = sum(sentiments) / len(sentiments) if sentiments else None
+        item['comment_sentiment_min'] = min(sentiments) if sentiments else None
+        negative = sum(1 for value in sentiments if value < self.sentiment_threshold)
+        item['negative_floor_ratio'] = negative / len(sentiments) if sentiments else None
+        item['risk_density'] = comment_hits / count if count else None
+
+    def should_alert(self, item, post_risk_level):
+        if item.get('sentiment', 0.5) < self.sentiment_threshold or post_risk_level >= self.risk_level:
+            return True
+        # 回帖较多时按回帖整体判断：负面楼层占比高、平均情感低或关键词密集
+        if item['comment_count'] < self.min_comments or item['negative_floor_ratio'] is None:
+            return False
+        return (
+            item['negative_floor_ratio'] >= self.negative_ratio
+            or item['comment_sentiment_mean'] < self.sentiment_threshold
+            or item['risk_density'] >= self.risk_density
+        )
+
+    def send_alert(self, item, spider):
+        """预警放入发送队列，由AlertDispatcher按时间窗口合并后推送到企业微信机器人，不阻塞管道"""
+        alert_msg = f"⚠️ NGA高风险内容告警\n标题：{item['title']}\n情感值：{item.get('sentiment', 0.5):.2f}\n关键词命中：{item['risk_level']}次\n链接：{item['url']}"
+        if item.get('negative_floor_ratio') is not None:
+            alert_msg += f"\n回帖：{item['comment_count']}楼，负面占比{item['negative_floor_ratio']:.0%}，平均情感{item['comment_sentiment_mean']:.2f}"
+        if self.dispatcher is None:
+            spider.logger.info(alert_msg)
+            return
+        self.dispatcher.submit(item['post_id'], alert_msg)
@@ -0,0 +1,81 @@
+import math
+import time
+
+
+class ForumSchedule:
+    """常驻监控模式下各板块的轮询计划
+
+    每次轮询结束后按观察到的新帖数估计新帖速率（指数平滑），
+    间隔取“平均每次轮询能看到target_new个新帖”所需的时间，并限制在[min_interval, max_interval]。
+    没有新帖时按backoff倍数退避。
+    """
+
+    def __init__(self, fids, min_interval=60, max_interval=1800, initial_interval=300,
+                 target_new=3, smoothing=0.5, backoff=1.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_new = target_new
+        self.smoothing = smoothing
+        self.backoff = backoff
+        now = time.time()
+        self.interval = {fid: initial_interval for fid in fids}
+        self.next_poll = {fid: now + initial_interval for fid in fids}
+        self.last_poll = {}
+        self.rate = {}
+
+    @classmethod
+    def from_settings(cls, fids, settings):
+        return cls(
+            fids,
+            min_interval=settings.getfloat('NGA_POLL_MIN_INTERVAL', 60),
+            max_interval=settings.getfloat('NGA_POLL_MAX_INTERVAL', 1800),
+            initial_interval=settings.getfloat('NGA_POLL_INITIAL_INTERVAL', 300),
+            target_new=settings.getfloat('NGA_POLL_TARGET_NEW', 3),
+        )
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        return [fid for fid, next_poll in self.next_poll.items() if next_poll <= now]
+
+    def start(self, fid, now=None):
+        """开始一次轮询；在轮询结果回来之前先按当前间隔排下一次，请求失败时也不会丢失该板块"""
+        now = time.time() if now is None else now
+        self.next_poll[fid] = now + self.interval[fid]
+        return self.last_poll.get(fid)
+
+    def record(self, fid, new_tids, started, previous, now=None):
+        """记录一次轮询的新帖数。started为本次轮询开始时间，previous为上一次（首次轮询为None）"""
+        now = time.time() if now is None else now
+        self.last_poll[fid] = started
+        if previous is None:
+            # 首次轮询时所有帖子都是“新”的，只作为基线不参与速率估计
+            return self.interval[fid]
+        elapsed = max(started - previous, 1.0)
+        sample = new_tids / elapsed
+        rate = self.rate.get(fid)
+        rate = sample if rate is None else self.smoothing * sample + (1 - self.smoothing) * rate
+        self.rate[fid] = rate
+        if new_tids == 0:
+            interval = self.interval[fid] * self.backoff
+        else:
+            interval = self.target_new / rate if rate > 0 else self.max_interval
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        self.interval[fid] = interval
+        self.next_poll[fid] = started + interval
+        return interval
+
+
+def thread_priority(replies, postdate, delta, hits, now=None, weights=(1.0, 1.0, 3.0)):
+    """根据列表页已有的数据估算帖子正文的抓取优先级，数值越大越先抓取
+
+    replies/postdate为回复数和发帖时间戳，delta为距上次抓取新增的回复数，hits为标题命中的风险词数。
+    回帖速度和新增回复取对数，避免个别超长帖子压过标题命中风险词的帖子。
+    """
+    now = time.time() if now is None else now
+    velocity_weight, delta_weight, risk_weight = weights
+    hours = max((now - postdate) / 3600, 0.25)
+    score = (velocity_weight * math.log1p(replies / hours)
+             + delta_weight * math.log1p(max(delta, 0))
+             + risk_weight * hits)
+    # 基准为1，仍排在列表页翻页请求（0）之前
+    return 1 + int(round(score * 10))
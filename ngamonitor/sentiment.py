@@ -0,0 +1,352 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from snownlp import SnowNLP
+from twisted.internet.defer import Deferred, DeferredSemaphore, succeed
+
+logger = logging.getLogger(__name__)
+
+# 长文本按该长度分块分别计算情感值后取平均
+CHUNK_SIZE = 500
+# 分析器版本，参与缓存键计算；更换模型后修改，旧缓存自然失效。
+# numpy实现与SnowNLP使用同一模型、结果一致，共用缓存
+ANALYZER_VERSION = 'snownlp-0.12'
+
+
+def split_chunks(content):
+    """按CHUNK_SIZE分块，超长文本丢弃空白块；不超过CHUNK_SIZE的文本整体作为一块"""
+    if len(content) > CHUNK_SIZE:
+        chunks = [content[i:i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE)]
+        return [chunk for chunk in chunks if chunk.strip()]
+    return [content]
+
+
+def resolve_analyzer(name):
+    """SENTIMENT_ANALYZER为numpy但未安装NumPy时退回SnowNLP"""
+    if name == 'numpy':
+        try:
+            import ngamonitor.nlp  # noqa: F401
+        except ImportError:
+            logger.warning("未安装numpy，情感分析改用SnowNLP")
+            return 'snownlp'
+    return name
+
+
+def text_sentiment(text):
+    return SnowNLP(text).sentiments
+
+
+def score_batch(texts, analyzer='snownlp'):
+    """逐块计算情感值，返回[(情感值, 错误信息), ...]，单块失败不影响同批其他文本（可在子进程中执行）"""
+    if analyzer == 'numpy':
+        from ngamonitor.nlp import get_scorer
+        try:
+            return [(value, None) for value in get_scorer().score_many(texts)]
+        except Exception:
+            # 整批失败时逐块用SnowNLP重算，定位出错的文本
+            pass
+    results = []
+    for text in texts:
+        try:
+            results.append((text_sentiment(text), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+
+def _warm_up(analyzer):
+    # 子进程启动时先加载模型，避免第一批请求承担加载耗时
+    score_batch(['预热'], analyzer)
+
+
+class SentimentCache:
+    """按(分析器版本, 分块内容)哈希缓存分块情感值：内存LRU + SQLite持久化两级
+
+    未变化的帖子重新抓取、回帖引用同一段文字时，相同的块只计算一次。
+    新结果先记在内存里，攒够WRITE_BATCH条再写库；超过ttl秒的记录在打开时清理。
+    """
+
+    WRITE_BATCH = 200
+
+    def __init__(self, path=None, max_entries=50000, ttl=30 * 86400, version=ANALYZER_VERSION, stats=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = version
+        self.stats = stats
+        self.memory = OrderedDict()
+        self.unsaved = {}
+        self.hits = 0
+        self.lookups = 0
+        self.conn = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('SENTIMENT_CACHE_ENABLED', True):
+            return None
+        return cls(
+            settings.get('SENTIMENT_CACHE_PATH'),
+            settings.getint('SENTIMENT_CACHE_MEMORY_ENTRIES', 50000),
+            settings.getfloat('SENTIMENT_CACHE_TTL', 30 * 86400),
+            stats=crawler.stats,
+        )
+
+    def open(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS chunks (key TEXT PRIMARY KEY, sentiment REAL, created REAL)')
+        if self.ttl > 0:
+            self.conn.execute('DELETE FROM chunks WHERE created < ?', (time.time() - self.ttl,))
+        self.conn.commit()
+
+    def close(self):
+        self.flush()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def key(self, text):
+        return hashlib.blake2b(f'{self.version}\0{text}'.encode('utf-8'), digest_size=16).hexdigest()
+
+    def get_many(self, texts):
+        """返回{文本: 情感值}，只包含命中的文本"""
+        found = {}
+        missing = {}
+        for text in texts:
+            key = self.key(text)
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                found[text] = self.memory[key]
+                self.inc('sentiment/cache/hit_memory')
+            else:
+                missing[key] = text
+        if missing and self.conn is not None:
+            keys = list(missing)
+            # 分批查询，避免超出SQLite变量个数上限
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, sentiment FROM chunks WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, value in rows:
+                    found[missing.pop(key)] = value
+                    self.remember(key, value)
+                    self.inc('sentiment/cache/hit_disk')
+        self.inc('sentiment/cache/miss', len(missing))
+        self.lookups += len(texts)
+        self.hits += len(texts) - len(missing)
+        if self.stats is not None and self.lookups:
+            self.stats.set_value('sentiment/cache/hit_rate', round(self.hits / self.lookups, 4))
+        return found
+
+    def put_many(self, values):
+        """values为{文本: 情感值}"""
+        now = time.time()
+        for text, value in values.items():
+            key = self.key(text)
+            self.remember(key, value)
+            self.unsaved[key] = (value, now)
+        if len(self.unsaved) >= self.WRITE_BATCH:
+            self.flush()
+
+    def remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def flush(self):
+        if not self.unsaved or self.conn is None:
+            self.unsaved.clear()
+            return
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO chunks (key, sentiment, created) VALUES (?, ?, ?)',
+            [(key, value, created) for key, (value, created) in self.unsaved.items()]
+        )
+        self.conn.commit()
+        self.unsaved.clear()
+
+    def inc(self, key, count=1):
+        if self.stats is not None and count:
+            self.stats.inc_value(key, count)
+
+
+class SentimentPool:
+    """把情感分析交给进程池，返回Deferred，不占用Twisted reactor线程
+
+    文本先进入待发送队列，攒够batch_size块或等待batch_delay秒后整批提交，减少进程间通信次数；
+    同时在进程池中执行的批次不超过max_inflight个，多出的批次排队等待（背压）。
+    """
+
+    def __init__(self, workers, batch_size=16, batch_delay=0.2, max_inflight=None, stats=None, analyzer='snownlp'):
+        self.workers = workers
+        self.analyzer = analyzer
+        self.batch_size = max(1, batch_size)
+        self.batch_delay = batch_delay
+        self.semaphore = DeferredSemaphore(max_inflight or workers * 2)
+        self.stats = stats
+        self.executor = None
+        self.pending = []
+        self.pending_texts = 0
+        self.flush_call = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        workers = settings.getint('SENTIMENT_WORKERS', 0)
+        if workers <= 0:
+            return None
+        return cls(
+            workers,
+            settings.getint('SENTIMENT_BATCH_SIZE', 16),
+            settings.getfloat('SENTIMENT_BATCH_DELAY', 0.2),
+            settings.getint('SENTIMENT_MAX_INFLIGHT', workers * 2),
+            crawler.stats,
+            resolve_analyzer(settings.get('SENTIMENT_ANALYZER', 'numpy')),
+        )
+
+    def open(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up, initargs=(self.analyzer,))
+        logger.info(f"情感分析进程池已启动: {self.workers}个进程, 分析器{self.analyzer}")
+
+    def close(self):
+        # 引擎关闭爬虫前会等待所有条目处理完成，这里只剩空队列
+        self.flush()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def score(self, texts):
+        """返回Deferred，回调参数为与texts一一对应的[(情感值, 错误信息), ...]"""
+        from twisted.internet import reactor
+        d = Deferred()
+        self.pending.append((texts, d))
+        self.pending_texts += len(texts)
+        if self.pending_texts >= self.batch_size:
+            self.flush()
+        elif self.flush_call is None:
+            self.flush_call = reactor.callLater(self.batch_delay, self.flush)
+        return d
+
+    def flush(self):
+        if self.flush_call is not None:
+            if self.flush_call.active():
+                self.flush_call.cancel()
+            self.flush_call = None
+        if not self.pending:
+            return
+        batch, self.pending, self.pending_texts = self.pending, [], 0
+        self.semaphore.run(self.submit, batch)
+
+    def submit(self, batch):
+        """提交一批到进程池，返回在批次完成时触发的Deferred（期间占用一个信号量名额）"""
+        from twisted.internet import reactor
+        done = Deferred()
+        started = time.monotonic()
+        future = self.executor.submit(score_batch, [text for texts, _ in batch for text in texts], self.analyzer)
+
+        def finish(future):
+            # 在进程池的结果线程中回调，转回reactor线程再触发Deferred
+            reactor.callFromThread(self.deliver, batch, future, started, done)
+
+        future.add_done_callback(finish)
+        return done
+
+    def deliver(self, batch, future, started, done):
+        count = sum(len(texts) for texts, _ in batch)
+        try:
+            results = future.result()
+        except Exception as e:
+            # 子进程崩溃等整批失败的情况
+            results = [(None, str(e))] * count
+        if self.stats is not None:
+            self.stats.inc_value('sentiment/batches')
+            self.stats.inc_value('sentiment/items', count)
+            self.stats.max_value('sentiment/batch_seconds_max', round(time.monotonic() - started, 3))
+        done.callback(None)
+        offset = 0
+        for texts, d in batch:
+            d.callback(results[offset:offset + len(texts)])
+            offset += len(texts)
+
+
+class SentimentAnalyzer:
+    """计算一组文档的情感值：先查缓存，未命中的分块去重后交给进程池（或在当前线程计算）
+
+    analyze()总是返回Deferred，回调参数为与documents一一对应的[(情感值, 错误信息), ...]；
+    文档任一分块计算失败时该文档返回错误信息。
+    """
+
+    def __init__(self, pool=None, cache=None, analyzer='numpy'):
+        self.pool = pool
+        self.cache = cache
+        self.analyzer = resolve_analyzer(analyzer)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            SentimentPool.from_crawler(crawler),
+            SentimentCache.from_crawler(crawler),
+            crawler.settings.get('SENTIMENT_ANALYZER', 'numpy'),
+        )
+
+    def open(self):
+        if self.cache is not None:
+            self.cache.open()
+        if self.pool is not None:
+            self.pool.open()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def analyze(self, documents):
+        chunked = [split_chunks(document) for document in documents]
+        unique = list(dict.fromkeys(chunk for chunks in chunked for chunk in chunks))
+        known = self.cache.get_many(unique) if self.cache is not None else {}
+        missing = [chunk for chunk in unique if chunk not in known]
+        if not missing:
+            return succeed(self.combine(chunked, known, {}))
+        if self.pool is not None:
+            d = self.pool.score(missing)
+        else:
+            d = succeed(score_batch(missing, self.analyzer))
+        d.addCallback(self.collect, chunked, known, missing)
+        return d
+
+    def collect(self, results, chunked, known, missing):
+        errors = {}
+        computed = {}
+        for chunk, (value, error) in zip(missing, results):
+            if error is None:
+                computed[chunk] = value
+            else:
+                errors[chunk] = error
+        if self.cache is not None and computed:
+            self.cache.put_many(computed)
+        known.update(computed)
+        return self.combine(chunked, known, errors)
+
+    def combine(self, chunked, known, errors):
+        results = []
+        for chunks in chunked:
+            error = next((errors[chunk] for chunk in chunks if chunk in errors), None)
+            if error is not None:
+                results.append((None, error))
+            elif chunks:
+                results.append((sum(known[chunk] for chunk in chunks) / len(chunks), None))
+            else:
+                results.append((0.5, None))
+        return results
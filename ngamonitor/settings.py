@@ -12,7 +12,7 @@ ROBOTSTXT_OBEY = False
 CONCURRENT_REQUESTS = 4
 DOWNLOAD_DELAY = 5  # 严格遵守15秒请求间隔
 
-AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_ENABLED = False  # 由AdaptiveThrottleMiddleware按403/登录跳转/延迟反馈调整
 AUTOTHROTTLE_START_DELAY = 3.0  # 初始延迟
 AUTOTHROTTLE_MAX_DELAY = 10.0   # 最大延迟
 AUTOTHROTTLE_TARGET_CONCURRENCY = 3.0  # 目标并发数
@@ -29,21 +29,59 @@ DEFAULT_REQUEST_HEADERS = {
 # 中间件配置
 DOWNLOADER_MIDDLEWARES = {
     'ngamonitor.middlewares.CustomHeadersMiddleware': 544,
-    'scrapy.downloadermiddlewares.retry.RetryMiddleware': 550,
+    'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
+    'ngamonitor.middlewares.BackoffRetryMiddleware': 550,
+    # 缓存排在会话池之前（默认900），命中缓存的请求不占用会话令牌，也不计入自适应限速
+    'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': 640,
+    'ngamonitor.middlewares.SessionPoolMiddleware': 650,
+    'ngamonitor.middlewares.AdaptiveThrottleMiddleware': 660,
 }
 
+# 自适应限速：每个(会话, 接口)单独调整，初始间隔为DOWNLOAD_DELAY
+NGA_THROTTLE_MIN_DELAY = 1.0  # 最小请求间隔（秒）
+NGA_THROTTLE_MAX_DELAY = 60.0  # 最大请求间隔（秒）
+NGA_THROTTLE_BACKOFF = 2.0  # 403/5xx/跳转登录页时间隔的放大倍数
+NGA_THROTTLE_DECREASE = 0.9  # 每次正常响应后间隔的缩小倍数
+NGA_THROTTLE_TARGET_LATENCY = 5.0  # 下载耗时超过该值时放慢
+NGA_THROTTLE_MAX_CONCURRENCY = 2  # 每个槽的最大并发
+NGA_THROTTLE_HEALTHY_STREAK = 10  # 连续正常响应多少次后并发加一
+
+# 多账号会话池：配置多个cookie后请求分摊到各会话，DOWNLOAD_DELAY按会话分别计算
+# 总并发仍受CONCURRENT_REQUESTS限制，会话较多时需相应调大
+NGA_SESSIONS = []  # cookie字符串列表
+NGA_SESSIONS_FILE = 'data/sessions.txt'  # 每行一个cookie字符串，#开头为注释
+NGA_SESSION_RATE = 0.2  # 每个会话每秒请求数
+NGA_SESSION_BURST = 3  # 每个会话可积攒的突发请求数
+
 # 管道配置
 ITEM_PIPELINES = {
+    'ngamonitor.pipelines.FrontierDedupPipeline': 200,
     'ngamonitor.pipelines.NgaMonitorPipeline': 300,
+    'ngamonitor.pipelines.SqliteStoragePipeline': 400,
+    'ngamonitor.pipelines.JsonLinesFeedPipeline': 500,
 }
 
 # 重试设置
 RETRY_TIMES = 2
 RETRY_HTTP_CODES = [500, 502, 503, 504, 408]
+RETRY_BACKOFF_BASE = 2.0  # 第n次重试等待 BASE * 2^(n-1) 秒，并加随机抖动
+RETRY_BACKOFF_MAX = 120.0  # 单次重试最长等待（秒）
+RETRY_BUDGET_RATIO = 0.2  # 重试总数不超过原始请求数的该比例（另加RETRY_BUDGET_MIN）
+RETRY_BUDGET_MIN = 10
 
 # 启用HTTP缓存（避免重复下载相同内容）
 HTTPCACHE_ENABLED = True
-HTTPCACHE_EXPIRATION_SECS = 3600  # 1小时缓存
+HTTPCACHE_EXPIRATION_SECS = 0  # 不按统一时长淘汰，由下面按URL类别的策略决定
+HTTPCACHE_POLICY = 'ngamonitor.httpcache.NgaCachePolicy'
+NGA_CACHE_LIST_TTL = 0  # 列表页（秒）：0表示每次都重新请求，服务器支持时做条件请求
+NGA_CACHE_READ_TTL = 7 * 86400  # 已满的帖子页
+NGA_CACHE_TAIL_TTL = 0  # 帖子最后一页，可能有新楼层
+NGA_CACHE_DEFAULT_TTL = 3600  # 其他页面
+HTTPCACHE_STORAGE = 'ngamonitor.httpcache.SqliteCacheStorage'  # 单文件压缩存储，旧版目录结构为scrapy.extensions.httpcache.FilesystemCacheStorage
+HTTPCACHE_IGNORE_QUERY_PARAMS = ['__timestamp']  # 缓存键忽略的URL参数（列表页的时间戳），只对SqliteCacheStorage生效
+HTTPCACHE_SQLITE_MAX_BYTES = 512 * 1024 * 1024  # 超过后按最近访问时间淘汰
+HTTPCACHE_SQLITE_COMPRESSION_LEVEL = 6  # zlib压缩级别
+HTTPCACHE_SQLITE_VACUUM_RATIO = 0.25  # 关闭时空闲页占比超过该值则压缩数据库文件
 
 # 其他设置
 FEED_EXPORT_ENCODING = 'utf-8'
@@ -55,4 +93,94 @@ USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36',
     'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Safari/605.1.15',
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0'
-]
\ No newline at end of file
+]
+
+# 增量爬取状态（按tid记录回复数，未变化的帖子跳过正文下载）
+CRAWL_STATE_ENABLED = True
+CRAWL_STATE_PATH = 'data/crawl_state.db'
+# NGA回帖每页楼层数，用于按上次最高楼层计算增量翻页的起始页
+NGA_FLOORS_PER_PAGE = 20
+# read.php使用__output=11请求JSON，解析失败时自动回退到HTML解析
+NGA_READ_JSON = True
+
+# 常驻监控模式（-a daemon=1）的板块轮询间隔（秒）：按新帖速率在上下限之间自适应
+NGA_POLL_MIN_INTERVAL = 60
+NGA_POLL_MAX_INTERVAL = 1800
+NGA_POLL_INITIAL_INTERVAL = 300
+NGA_POLL_TARGET_NEW = 3  # 期望每次轮询平均看到的新帖数
+
+# 多worker共享队列（-a frontier=data/frontier.db）
+NGA_FRONTIER_BATCH = 8  # 每个worker同时在途的正文请求数上限
+NGA_FRONTIER_LEASE_TIMEOUT = 600  # 领取后超过该秒数未完成则允许其他worker重新领取
+NGA_FRONTIER_MAX_ATTEMPTS = 3  # 每个帖子最多领取次数，超过后放弃，回复数增加时重新入队
+
+# 跨运行持久化去重（磁盘布隆滤波器），只对匹配的URL生效，其余请求仍在内存中去重
+DUPEFILTER_CLASS = 'ngamonitor.dupefilter.PersistentBloomDupeFilter'
+DUPEFILTER_BLOOM_PATH = 'data/dupefilter'
+DUPEFILTER_BLOOM_PATTERNS = [r'/read\.php']
+DUPEFILTER_BLOOM_CAPACITY = 1000000  # 每代容量
+DUPEFILTER_BLOOM_ERROR_RATE = 0.001  # 误判率
+DUPEFILTER_BLOOM_TTL = 7 * 86400  # 记录保留时长（秒）
+DUPEFILTER_BLOOM_GENERATIONS = 4  # 按时间分代，过期整代删除
+
+# 风险关键词（帖子标题用于正文抓取优先级，正文用于风险等级和预警）
+RISK_KEYWORDS = ['bug', '国服', '雷火', '退款', '封号', '客服', '垃圾', '运营', 'BUG']
+RISK_KEYWORDS_FILE = 'data/risk_keywords.txt'  # 每行一个关键词，存在时代替RISK_KEYWORDS，修改后自动生效
+RISK_KEYWORDS_RELOAD_INTERVAL = 5  # 检查关键词文件是否修改的间隔（秒）
+
+# 正文抓取优先级权重：回帖速度（回复/小时）、距上次新增回复数、标题命中风险词数
+NGA_PRIORITY_VELOCITY_WEIGHT = 1.0
+NGA_PRIORITY_DELTA_WEIGHT = 1.0
+NGA_PRIORITY_RISK_WEIGHT = 3.0
+
+# 轻量模式（-a lite=1）：只为通过标题预筛的帖子下载正文，其余帖子只输出列表页信息
+NGA_LITE_MIN_HITS = 1  # 标题命中风险词数达到该值即抓取正文
+NGA_LITE_MIN_DELTA = 20  # 距上次抓取新增回复数达到该值即抓取正文
+NGA_LITE_MIN_VELOCITY = 30  # 回帖速度（回复/小时，从发帖起算）达到该值即抓取正文
+NGA_LITE_SENTIMENT = False  # 是否对标题做情感分析预筛（每个列表页的标题一起用NumPy实现计算）
+NGA_LITE_SENTIMENT_THRESHOLD = 0.3  # 标题情感值低于该值即抓取正文
+
+# 情感分析器：numpy为SnowNLP模型的向量化实现（结果一致、快一个数量级），snownlp为逐条调用SnowNLP
+SENTIMENT_ANALYZER = 'numpy'
+# 情感分析进程池：正文分批交给子进程计算，不阻塞reactor线程；设为0则在主线程中同步计算
+SENTIMENT_WORKERS = 2  # 子进程数，建议不超过CPU核数
+SENTIMENT_BATCH_SIZE = 64  # 每批文本块数（500字一块），numpy分析器批量越大越快
+SENTIMENT_BATCH_DELAY = 0.2  # 不足一批时最多等待的秒数
+SENTIMENT_MAX_INFLIGHT = 4  # 同时在进程池中执行的批次数上限，超出后排队
+
+# 情感值缓存：按分块内容哈希缓存，未变化的正文和重复引用的文字不再重复计算
+SENTIMENT_CACHE_ENABLED = True
+SENTIMENT_CACHE_PATH = 'data/sentiment_cache.db'
+SENTIMENT_CACHE_MEMORY_ENTRIES = 50000  # 内存LRU容量（块数）
+SENTIMENT_CACHE_TTL = 30 * 86400  # 磁盘缓存保留时长（秒）
+
+# 预警条件：主楼情感值或命中关键词数达到阈值，或回帖数不少于ALERT_MIN_COMMENTS时按回帖整体情况判断
+ALERT_SENTIMENT_THRESHOLD = 0.3  # 情感值低于该值视为负面（主楼、单条回帖、回帖均值）
+ALERT_RISK_LEVEL = 2  # 主楼（标题和正文）命中不同关键词数
+ALERT_MIN_COMMENTS = 5
+ALERT_NEGATIVE_RATIO = 0.5  # 负面楼层占比
+ALERT_RISK_DENSITY = 1.0  # 平均每楼关键词命中次数
+
+# 预警推送（企业微信机器人Webhook，留空则只写日志）
+ALERT_WEBHOOK_URL = ''  # 如 https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=YOUR_KEY
+ALERT_DIGEST_WINDOW = 60  # 每隔多少秒把队列中的预警合并发送一次
+ALERT_DIGEST_MAX = 10  # 每条摘要最多合并的预警数
+ALERT_DIGEST_MAX_BYTES = 2048  # 每条摘要UTF-8编码后的字节上限（企业微信text.content最长2048字节）
+ALERT_DEDUP_TTL = 3600  # 同一帖子在该秒数内只预警一次
+ALERT_QUEUE_MAX = 1000  # 队列上限，超出时丢弃最早的预警
+ALERT_MAX_RETRIES = 5
+ALERT_BACKOFF_BASE = 2  # 第n次重试前等待约BASE*2^(n-1)秒
+ALERT_BACKOFF_MAX = 300
+ALERT_TIMEOUT = 10  # 单次请求超时（秒）
+
+# 帖子和回帖写入SQLite（GUI和导出脚本从这里读取）
+SQLITE_STORAGE_PATH = 'data/nga.db'
+SQLITE_STORAGE_BATCH = 50  # 每个事务写入的条目数
+SQLITE_STORAGE_FLUSH_INTERVAL = 5  # 不足一批时最多等待的秒数
+
+# JSON Lines输出（每条记录一行，代替-o output.json；读取见ngamonitor.feed.FeedReader）
+JSONL_FEED_DIR = 'data/feed'  # 多worker模式下每个worker写入<目录>/<worker>
+JSONL_FEED_MAX_BYTES = 64 * 1024 * 1024  # 单个段文件超过该大小时切换到新文件
+JSONL_FEED_ROTATE_INTERVAL = 3600  # 单个段文件最长写入时间（秒）
+JSONL_FEED_SYNC_ITEMS = 50  # 每写入该条数fsync一次
+JSONL_FEED_SYNC_INTERVAL = 5  # 不足该条数时最多等待的秒数
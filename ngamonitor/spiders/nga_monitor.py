@@ -1,11 +1,24 @@
 import scrapy
+import os
+import socket
 import time
 import random
 import json
 from urllib.parse import urlencode
 from datetime import datetime
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
 from scrapy.spidermiddlewares.httperror import HttpError
 from twisted.internet.error import ConnectionRefusedError
+from ngamonitor.state import CrawlState
+from ngamonitor.parsers import load_read_json, parse_read_json, extract_html_comments
+from ngamonitor.schedule import ForumSchedule, thread_priority
+from ngamonitor.keywords import KeywordSet
+from ngamonitor.frontier import SharedFrontier
+from ngamonitor.dupefilter import PersistentBloomDupeFilter
+from ngamonitor.middlewares import RetryScheduled
+from ngamonitor.sentiment import resolve_analyzer, score_batch
+from scrapy.utils.misc import load_object
 
 class NgaMonitorSpider(scrapy.Spider):
     name = 'nga_monitor'
@@ -44,30 +57,134 @@ class NgaMonitorSpider(scrapy.Spider):
             self.fid_list = [int(f) for f in str(fid_arg).split(',') if f.strip()]
         else:
             self.fid_list = [7, 459, 422, 624, 850]
+        # shard=i/n 时只抓取fid_list中第i份（从0开始）的板块列表页，用于多进程分片
+        shard = kwargs.get('shard')
+        if shard:
+            index, count = (int(x) for x in str(shard).split('/'))
+            self.fid_list = self.fid_list[index::count]
+        # frontier=路径 时帖子正文经共享队列分发，多个worker共同领取
+        self.frontier_path = kwargs.get('frontier')
+        self.worker = kwargs.get('worker') or f'{socket.gethostname()}-{os.getpid()}'
+        # 列表页最大翻页深度，空值或非数字时使用默认值
+        try:
+            self.pages = max(int(kwargs.get('pages') or 3), 1)
+        except (TypeError, ValueError):
+            self.logger.warning(f"pages参数无效: {kwargs.get('pages')!r}，使用默认值3")
+            self.pages = 3
+        # full=1 时忽略增量状态，强制重新抓取所有帖子正文
+        self.full = str(kwargs.get('full', '0')).lower() in ('1', 'true', 'yes')
+        # daemon=1 时常驻运行，由spider_idle信号按各板块的轮询间隔重新抓取列表页
+        self.daemon = str(kwargs.get('daemon', '0')).lower() in ('1', 'true', 'yes')
+        # lite=1 时只根据标题预筛，未通过预筛的帖子只输出列表页信息，不下载正文
+        self.lite = str(kwargs.get('lite', '0')).lower() in ('1', 'true', 'yes')
+        self.state = None
+        self.schedule = None
+        self.frontier = None
+        self.known_tids = set()
+        self.bloom = None
+        # 轻量模式的标题情感值，常驻模式下同一标题每轮都会出现
+        self.title_sentiments = {}
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if crawler.settings.getbool('CRAWL_STATE_ENABLED', True):
+            spider.state = CrawlState.from_settings(crawler.settings)
+            crawler.signals.connect(spider.close_state, signal=signals.spider_closed)
+        spider.keywords = KeywordSet.from_settings(crawler.settings)
+        spider.priority_weights = (
+            crawler.settings.getfloat('NGA_PRIORITY_VELOCITY_WEIGHT', 1.0),
+            crawler.settings.getfloat('NGA_PRIORITY_DELTA_WEIGHT', 1.0),
+            crawler.settings.getfloat('NGA_PRIORITY_RISK_WEIGHT', 3.0),
+        )
+        # 持久化去重按帖子ID:回复数:页码判重，常驻模式下无需再绕过去重
+        spider.keyed_dupefilter = issubclass(load_object(crawler.settings['DUPEFILTER_CLASS']), PersistentBloomDupeFilter)
+        if spider.keyed_dupefilter:
+            crawler.signals.connect(spider.open_dupefilter, signal=signals.spider_opened)
+        if spider.frontier_path:
+            spider.frontier = SharedFrontier.from_settings(spider.frontier_path, crawler.settings)
+            crawler.signals.connect(spider.close_frontier, signal=signals.spider_closed)
+        if spider.daemon:
+            spider.schedule = ForumSchedule.from_settings(spider.fid_list, crawler.settings)
+            if crawler.settings.getint('CLOSESPIDER_ITEMCOUNT'):
+                spider.logger.warning("常驻监控模式下CLOSESPIDER_ITEMCOUNT仍会关闭爬虫，建议传入 -s CLOSESPIDER_ITEMCOUNT=0")
+        if spider.daemon or spider.frontier is not None:
+            crawler.signals.connect(spider.on_idle, signal=signals.spider_idle)
+        return spider
+
+    def open_dupefilter(self, spider):
+        # 引擎启动后才有调度器；基准回放等脱离引擎调用回调时保持为None
+        df = getattr(self.crawler.engine.scheduler, 'df', None)
+        self.bloom = df if isinstance(df, PersistentBloomDupeFilter) else None
+
+    def close_state(self, spider):
+        if self.state is not None:
+            self.state.close()
+
+    def close_frontier(self, spider):
+        if self.frontier is not None:
+            self.frontier.close()
 
     def start_requests(self):
         for fid in self.fid_list:
-            params = {
-                'fid': fid,
-                'page': 1,
-                '__uid': self.uid,
-                '__timestamp': int(time.time()),
-                '__output': '11'
-            }
-            url = f"https://bbs.nga.cn/thread.php?{urlencode(params)}"
-        
-            yield scrapy.Request(
-                url=url,
-                cookies=self.cookies,
-                headers=self.get_dynamic_headers(),
-                callback=self.parse_forum,
-                meta={'fid': fid, 'page': 1},
-                errback=self.handle_error
-            )
+            yield self.make_forum_request(fid, 1, self.start_poll(fid))
+
+    def start_poll(self, fid):
+        """记录一次轮询的起止信息，随列表页翻页在meta中传递"""
+        now = time.time()
+        previous = self.schedule.start(fid, now) if self.schedule is not None else None
+        # 本轮翻页统一以轮询开始时的发帖时间水位为准，翻页过程中更新的水位不影响本轮判断
+        watermark = None
+        if self.state is not None and not self.full:
+            watermark = self.state.get_watermark(fid)
+        return {'started': now, 'previous': previous, 'new_tids': 0, 'watermark': watermark}
+
+    def on_idle(self, spider):
+        keep_open = False
+        # 共享队列中还有未完成的帖子时继续领取；被其他worker领取的帖子租约超时后也会回到队列
+        if self.frontier is not None:
+            for request in self.lease_posts():
+                self.crawler.engine.crawl(request)
+            keep_open = self.frontier.pending() > 0
+        # 常驻模式下为到期的板块重新发起列表页请求，并阻止爬虫关闭
+        if self.schedule is not None:
+            for fid in self.schedule.due():
+                self.crawler.engine.crawl(self.make_forum_request(fid, 1, self.start_poll(fid)))
+            keep_open = True
+        if keep_open:
+            raise DontCloseSpider
+
+    def lease_posts(self):
+        """从共享队列领取帖子，本worker在途的正文请求不超过NGA_FRONTIER_BATCH个"""
+        limit = self.settings.getint('NGA_FRONTIER_BATCH', 8) - self.frontier.outstanding(self.worker)
+        if limit <= 0:
+            return
+        for item, start_page, last_page, max_floor, priority in self.frontier.lease(self.worker, limit):
+            self.crawler.stats.inc_value('nga/frontier/leased')
+            yield self.make_post_request(item, start_page, last_page, max_floor, priority, frontier=True)
+
+    def make_forum_request(self, fid, page, poll):
+        params = {
+            'fid': fid,
+            'page': page,
+            '__uid': self.uid,
+            '__timestamp': int(time.time()),
+            '__output': '11'
+        }
+        url = f"https://bbs.nga.cn/thread.php?{urlencode(params)}"
+        return scrapy.Request(
+            url=url,
+            cookies=self.cookies,
+            headers=self.get_dynamic_headers(),
+            callback=self.parse_forum,
+            meta={'fid': fid, 'page': page, 'poll': poll},
+            errback=self.handle_error
+        )
 
     def parse_forum(self, response):
         fid = response.meta['fid']
         current_page = response.meta['page']
+        poll = dict(response.meta.get('poll') or {'started': time.time(), 'previous': None, 'new_tids': 0, 'watermark': None})
         
         if 'login.php' in response.url:
             self.logger.error(f"需要重新登录！当前Cookies已失效")
@@ -76,6 +193,7 @@ class NgaMonitorSpider(scrapy.Spider):
         try:
             data = response.json()
             threads = data['data']['__T']
+            titles = [thread['subject'] for thread in threads]
             
             for thread in threads:
                 item = {
@@ -88,87 +206,209 @@ class NgaMonitorSpider(scrapy.Spider):
                     'post_time': datetime.fromtimestamp(thread['postdate']).strftime('%Y-%m-%d %H:%M:%S'),
                     'crawl_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 }
-                
-                yield scrapy.Request(
-                    url=item['url'],
-                    cookies=self.cookies,
-                    headers=self.get_dynamic_headers(),
-                    callback=self.parse_post,
-                    meta={'item': item},
-                    priority=1
-                )
-
-            if current_page < 3 and data['data'].get('__next__'):
-                next_page = current_page + 1
-                params = {
-                    'fid': fid,
-                    'page': next_page,
-                    '__uid': self.uid,
-                    '__timestamp': int(time.time()),
-                    '__output': '11'
-                }
-                next_url = f"https://bbs.nga.cn/thread.php?{urlencode(params)}"
-                yield scrapy.Request(
-                    url=next_url,
-                    cookies=self.cookies,
-                    headers=self.get_dynamic_headers(),
-                    callback=self.parse_forum,
-                    meta={'fid': fid, 'page': next_page},
-                    errback=self.handle_error
-                )
-                
+
+                state = self.state.get(item['post_id']) if self.state is not None else None
+                if item['post_id'] not in self.known_tids and state is None:
+                    poll['new_tids'] += 1
+                self.known_tids.add(item['post_id'])
+                if self.full:
+                    state = None
+                # 回复数未变化的帖子无需重新下载正文
+                if state is not None and state['reply_count'] == item['reply_count']:
+                    self.crawler.stats.inc_value('nga/state/skipped')
+                    continue
+                # 轻量模式下上次预筛之后没有新回复的帖子不再重复预筛
+                if self.lite and state is not None and state['screened_reply_count'] == item['reply_count']:
+                    self.crawler.stats.inc_value('nga/lite/unchanged')
+                    continue
+
+                # 从上次已采集的最高楼层所在页开始增量翻页
+                max_floor = state['max_floor'] if state is not None and state['max_floor'] is not None else -1
+                per_page = self.settings.getint('NGA_FLOORS_PER_PAGE', 20)
+                start_page = (max_floor + 1) // per_page + 1
+                last_page = item['reply_count'] // per_page + 1
+                if start_page > 1:
+                    self.crawler.stats.inc_value('nga/state/delta_threads')
+                    self.crawler.stats.inc_value('nga/state/pages_skipped', start_page - 1)
+
+                # 回帖快、新增回复多、标题命中风险词的帖子优先下载正文
+                delta = item['reply_count'] - ((state['reply_count'] or 0) if state is not None else 0)
+                hits = self.keywords.matcher().count_distinct(item['title'])
+                priority = thread_priority(item['reply_count'], thread['postdate'], delta, hits,
+                                           weights=self.priority_weights)
+                self.crawler.stats.max_value('nga/priority/max', priority)
+
+                if self.lite and not self.is_candidate(item, hits, delta, thread['postdate'], titles):
+                    # 只记录预筛时的回复数，下次有新增回复时才重新预筛；
+                    # 上次下载正文时的回复数和楼层水位不变，增量、优先级和非轻量模式的判断仍以其为准
+                    if self.state is not None:
+                        self.state.mark_screened(item['post_id'], fid, item['reply_count'])
+                    self.crawler.stats.inc_value('nga/lite/skipped')
+                    item.update({'content': '', 'comments': [], 'lite': True})
+                    yield item
+                    continue
+                if self.lite:
+                    self.crawler.stats.inc_value('nga/lite/candidates')
+
+                if self.frontier is not None:
+                    # 多worker模式：写入共享队列去重，由各worker按租约领取
+                    pushed = self.frontier.push(item, min(start_page, last_page), last_page, max_floor, priority)
+                    self.crawler.stats.inc_value('nga/frontier/pushed' if pushed else 'nga/frontier/duplicate')
+                    continue
+                yield self.make_post_request(item, min(start_page, last_page), last_page, max_floor, priority)
+
+            if self.frontier is not None:
+                yield from self.lease_posts()
+
+            # 本页全部早于水位时，更深的页面也不会有新帖，停止翻页
+            postdates = [thread['postdate'] for thread in threads]
+            watermark = poll.get('watermark')
+            reached_watermark = bool(postdates) and watermark is not None and max(postdates) <= watermark
+            if postdates and self.state is not None:
+                self.state.update_watermark(fid, max(postdates))
+            if reached_watermark:
+                self.crawler.stats.inc_value('nga/watermark/stopped')
+
+            if current_page < self.pages and data['data'].get('__next__') and not reached_watermark:
+                yield self.make_forum_request(fid, current_page + 1, poll)
+            elif self.schedule is not None:
+                interval = self.schedule.record(fid, poll['new_tids'], poll['started'], poll['previous'])
+                self.crawler.stats.set_value(f'nga/poll/{fid}/interval', round(interval, 1))
+                self.logger.info(f"板块{fid}本轮新帖{poll['new_tids']}个，下次轮询间隔{interval:.0f}秒")
+
         except (json.JSONDecodeError, KeyError) as e:
             self.logger.error(f"JSON解析失败: {e}, URL: {response.url}")
 
+    def is_candidate(self, item, hits, delta, postdate, titles=()):
+        """轻量模式的预筛：标题命中风险词、距上次新增回复多、回帖速度快，或标题情感值过低
+
+        titles为同一列表页的全部标题，需要情感值时整页一起计算。
+        """
+        if hits >= self.settings.getint('NGA_LITE_MIN_HITS', 1):
+            return True
+        if delta >= self.settings.getint('NGA_LITE_MIN_DELTA', 20):
+            return True
+        hours = max((time.time() - postdate) / 3600, 0.25)
+        if item['reply_count'] / hours >= self.settings.getfloat('NGA_LITE_MIN_VELOCITY', 30):
+            return True
+        if self.settings.getbool('NGA_LITE_SENTIMENT') and item['title']:
+            sentiment = self.title_sentiment(item['title'], titles)
+            if sentiment is not None:
+                return sentiment < self.settings.getfloat('NGA_LITE_SENTIMENT_THRESHOLD', 0.3)
+        return False
+
+    def title_sentiment(self, title, titles=()):
+        """标题情感值，计算失败时返回None；未缓存的标题连同本页其他标题用NumPy实现批量计算，不逐条调用SnowNLP"""
+        if title not in self.title_sentiments:
+            missing = list(dict.fromkeys(t for t in (title, *titles) if t and t not in self.title_sentiments))
+            if len(self.title_sentiments) + len(missing) > 10000:
+                self.title_sentiments.clear()
+            for text, (value, error) in zip(missing, score_batch(missing, resolve_analyzer('numpy'))):
+                if error is not None:
+                    self.logger.error(f"标题情感分析失败: {error}")
+                self.title_sentiments[text] = value
+            self.crawler.stats.inc_value('nga/lite/sentiment_titles', len(missing))
+        return self.title_sentiments[title]
+
+    def make_post_request(self, item, page, last_page, max_floor, priority=1, frontier=False):
+        params = {}
+        if page > 1:
+            params['page'] = page
+        # 优先请求JSON输出，体积更小且无需构建HTML树
+        if self.settings.getbool('NGA_READ_JSON', True):
+            params['__output'] = '11'
+        url = f"{item['url']}&{urlencode(params)}" if params else item['url']
+        meta = {
+            'item': item, 'page': page, 'last_page': last_page, 'max_floor': max_floor, 'priority': priority,
+            # 回复数不变时同一页内容不变，回复数增加后视为新请求
+            'dupefilter_key': f"{item['post_id']}:{item.get('reply_count')}:{page}"
+        }
+        if self.full:
+            meta['bloom_dupefilter'] = False
+        if frontier:
+            # 共享队列本身负责跨worker去重，重新领取的帖子不能被本地的任何去重拦下
+            meta['frontier'] = True
+            meta['bloom_dupefilter'] = False
+        # 最后一页会随新回复变化，不能长期复用缓存
+        if page >= last_page:
+            meta['httpcache_ttl'] = self.settings.getfloat('NGA_CACHE_TAIL_TTL', 0)
+        return scrapy.Request(
+            url=url,
+            cookies=self.cookies,
+            headers=self.get_dynamic_headers(),
+            callback=self.parse_post,
+            meta=meta,
+            priority=priority,
+            # 常驻模式下同一帖子会被多次抓取，内存去重无法区分回复数，由增量状态决定是否抓取
+            dont_filter=frontier or (self.daemon and not self.keyed_dupefilter),
+            errback=self.handle_error
+        )
+
     def parse_post(self, response):
         item = response.meta['item']
-        content_parts = response.css('#postcontent0 ::text').getall()
-        item['content'] = ''.join(content_parts).strip()
-        
-        comments = []
-        # 兼容NGA多种回帖结构，采集主楼以外所有楼层
-        # 1. 先尝试div[id^="post"]，主楼通常id=post1
-        floors = response.css('div[id^="post"]')
-        for floor in floors:
-            post_id_attr = floor.attrib.get('id', '')
-            if post_id_attr == 'post1':
-                continue
-            # 兼容部分页面主楼id可能不是post1，跳过第一个楼层
-            if post_id_attr and floors.index(floor) == 0:
-                continue
-            # 只采集有内容的楼层
-            content = ''.join(floor.css('.postcontent ::text').getall()).strip()
-            if not content:
-                continue
-            author = floor.css('a.author::text').get() or floor.css('.author::text').get()
-            floor_num = floor.css('span.floor::text').get('')
-            post_time = floor.css('span.postInfo::text').re_first(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}')
-            comments.append({
-                'post_id': item['post_id'],
-                'author': author,
-                'content': content,
-                'floor': floor_num.replace('#', '') if floor_num else '',
-                'post_time': post_time
-            })
-        # 2. 如果上面没采到，尝试div.reply/postbox.reply等其它常见结构
-        if not comments:
-            for floor in response.css('div.reply,div.postbox.reply'):
-                content = ''.join(floor.css('.postcontent ::text').getall()).strip()
-                if not content:
+        page = response.meta.get('page', 1)
+        last_page = response.meta.get('last_page', 1)
+        max_floor = response.meta.get('max_floor', -1)
+        data = load_read_json(response.text)
+        if data is not None:
+            content, page_comments = parse_read_json(data, item['post_id'])
+            self.crawler.stats.inc_value('nga/parse/json')
+        else:
+            # 服务器未返回JSON（登录页、旧接口等）时回退到HTML解析
+            content = ''.join(response.css('#postcontent0 ::text').getall()).strip()
+            page_comments = self.extract_comments(response, item['post_id'])
+            self.crawler.stats.inc_value('nga/parse/html')
+        # 解析出内容才写入持久化去重；登录页、空页面下次运行仍会重新请求
+        if page_comments or (page == 1 and content):
+            self.mark_seen(response.request)
+        else:
+            self.forget_seen(response.request)
+        # 主楼内容只在第一页
+        if page == 1:
+            item['content'] = content or ''
+
+        # 只保留上次之后新增的楼层
+        comments = item.setdefault('comments', [])
+        seen_floor = response.meta.get('seen_floor')
+        for comment in page_comments:
+            floor = floor_number(comment)
+            if floor is not None:
+                seen_floor = max(floor, seen_floor if seen_floor is not None else -1)
+                if floor <= max_floor:
                     continue
-                author = floor.css('a.author::text').get() or floor.css('.author::text').get()
-                floor_num = floor.css('span.floor::text').get('')
-                post_time = floor.css('span.postInfo::text').re_first(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}')
-                comments.append({
-                    'post_id': item['post_id'],
-                    'author': author,
-                    'content': content,
-                    'floor': floor_num.replace('#', '') if floor_num else '',
-                    'post_time': post_time
-                })
-        item['comments'] = comments
+            comments.append(comment)
+
+        if page < last_page:
+            request = self.make_post_request(item, page + 1, last_page, max_floor, response.meta.get('priority', 1),
+                                             frontier=bool(response.meta.get('frontier')))
+            request.meta['seen_floor'] = seen_floor
+            yield request
+            return
+
+        if response.meta.get('frontier'):
+            self.frontier.complete(item['post_id'])
+
+        # 正文为空多为游客/登录页，不记录状态以免下次被误跳过
+        if self.state is not None and (item.get('content') or seen_floor is not None):
+            # 解析不到楼层号时以列表页回复数作为已采集的最高楼层
+            if seen_floor is None:
+                seen_floor = item.get('reply_count')
+            self.state.update(item['post_id'], item.get('fid'), item.get('reply_count'),
+                              item.get('content'), seen_floor)
         yield item
 
+    def mark_seen(self, request):
+        if self.bloom is not None:
+            self.bloom.mark_seen(request)
+
+    def forget_seen(self, request):
+        if self.bloom is not None:
+            self.bloom.forget(request)
+
+    def extract_comments(self, response, post_id):
+        # 兼容NGA多种回帖结构，采集主楼以外所有楼层（见 parsers.extract_html_comments）
+        return extract_html_comments(response.selector.root, post_id)
+
     def get_dynamic_headers(self):
         return {
             'User-Agent': random.choice([
@@ -182,6 +422,9 @@ class NgaMonitorSpider(scrapy.Spider):
         }
 
     def handle_error(self, failure):
+        # 重试统一由BackoffRetryMiddleware按退避时间安排，这里只处理最终失败
+        if failure.check(RetryScheduled):
+            return
         self.logger.error(f"请求失败: {failure.request.url}")
         
         if failure.check(HttpError):
@@ -190,12 +433,18 @@ class NgaMonitorSpider(scrapy.Spider):
                 self.logger.warning("触发403限制，建议更新Cookies")
         elif failure.check(ConnectionRefusedError):
             self.logger.warning("连接被拒绝")
-        
-        retry_times = failure.request.meta.get('retry_times', 0)
-        if retry_times < self.settings.getint('RETRY_TIMES'):
-            retryreq = failure.request.copy()
-            retryreq.meta['retry_times'] = retry_times + 1
-            retryreq.dont_filter = True
-            return retryreq
-        
-        self.logger.error(f"放弃重试: {failure.request.url}")
\ No newline at end of file
+
+        self.logger.error(f"放弃重试: {failure.request.url}")
+        self.forget_seen(failure.request)
+        # 还有尝试次数的帖子放回共享队列，由任意worker重新领取
+        if failure.request.meta.get('frontier'):
+            item = failure.request.meta['item']
+            if self.frontier.fail(item['post_id']):
+                self.crawler.stats.inc_value('nga/frontier/failed')
+                self.logger.error(f"帖子{item['post_id']}多次抓取失败，已放弃")
+
+
+def floor_number(comment):
+    """comment['floor']转为整数楼层号，无法解析时返回None"""
+    floor = str(comment.get('floor') or '').strip()
+    return int(floor) if floor.isdigit() else None
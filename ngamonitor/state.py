@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import hashlib
+import time
+
+
+class CrawlState:
+    """基于SQLite的增量爬取状态库，按tid记录上次下载正文时的回复数、内容哈希和爬取时间
+
+    轻量模式预筛未通过的帖子只记录screened_reply_count，不改变reply_count，
+    回复增量、跳过判断和优先级始终以上次下载正文时为基准。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 多个worker可共用同一个状态库
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS threads ('
+            ' tid INTEGER PRIMARY KEY,'
+            ' fid INTEGER,'
+            ' reply_count INTEGER,'
+            ' content_hash TEXT,'
+            ' crawl_time REAL,'
+            ' max_floor INTEGER,'
+            ' screened_reply_count INTEGER'
+            ')'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS forums ('
+            ' fid INTEGER PRIMARY KEY,'
+            ' watermark INTEGER,'
+            ' updated REAL'
+            ')'
+        )
+        # 兼容旧版本状态库：补充max_floor、screened_reply_count列
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(threads)')]
+        if 'max_floor' not in columns:
+            self.conn.execute('ALTER TABLE threads ADD COLUMN max_floor INTEGER')
+        if 'screened_reply_count' not in columns:
+            self.conn.execute('ALTER TABLE threads ADD COLUMN screened_reply_count INTEGER')
+        self.conn.commit()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.get('CRAWL_STATE_PATH', 'data/crawl_state.db'))
+
+    def get(self, tid):
+        row = self.conn.execute(
+            'SELECT reply_count, content_hash, crawl_time, max_floor, screened_reply_count FROM threads WHERE tid = ?',
+            (tid,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'reply_count': row[0], 'content_hash': row[1], 'crawl_time': row[2], 'max_floor': row[3],
+                'screened_reply_count': row[4]}
+
+    def is_unchanged(self, tid, reply_count):
+        """列表页给出的回复数与上次爬取一致时视为未变化"""
+        state = self.get(tid)
+        return state is not None and state['reply_count'] == reply_count
+
+    def update(self, tid, fid, reply_count, content=None, max_floor=None):
+        """content/max_floor为None时保留库中原值（增量翻页时拿不到主楼内容）"""
+        self.conn.execute(
+            'INSERT INTO threads (tid, fid, reply_count, content_hash, crawl_time, max_floor) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(tid) DO UPDATE SET fid = excluded.fid, reply_count = excluded.reply_count, '
+            'content_hash = COALESCE(excluded.content_hash, threads.content_hash), crawl_time = excluded.crawl_time, '
+            'max_floor = MAX(COALESCE(excluded.max_floor, -1), COALESCE(threads.max_floor, -1))',
+            (tid, fid, reply_count, content_hash(content) if content is not None else None, time.time(), max_floor)
+        )
+        self.conn.commit()
+
+    def mark_screened(self, tid, fid, reply_count):
+        """记录轻量模式预筛时的回复数；从未下载过正文的帖子reply_count保持为空"""
+        self.conn.execute(
+            'INSERT INTO threads (tid, fid, screened_reply_count) VALUES (?, ?, ?) '
+            'ON CONFLICT(tid) DO UPDATE SET fid = excluded.fid, screened_reply_count = excluded.screened_reply_count',
+            (tid, fid, reply_count)
+        )
+        self.conn.commit()
+
+    def get_watermark(self, fid):
+        """板块已见过的最新发帖时间（postdate时间戳），没有记录时返回None"""
+        row = self.conn.execute('SELECT watermark FROM forums WHERE fid = ?', (fid,)).fetchone()
+        return row[0] if row else None
+
+    def update_watermark(self, fid, postdate):
+        self.conn.execute(
+            'INSERT INTO forums (fid, watermark, updated) VALUES (?, ?, ?) '
+            'ON CONFLICT(fid) DO UPDATE SET watermark = MAX(excluded.watermark, COALESCE(forums.watermark, 0)), '
+            'updated = excluded.updated',
+            (fid, postdate, time.time())
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def content_hash(content):
+    return hashlib.sha1((content or '').encode('utf-8')).hexdigest()
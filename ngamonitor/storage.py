@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# 帖子表中直接按条目字段保存的列（risk_keywords、risk_hits以JSON保存）
+POST_COLUMNS = (
+    'post_id', 'fid', 'title', 'url', 'author', 'content', 'reply_count', 'post_time', 'crawl_time',
+    'sentiment', 'risk_level', 'risk_keywords', 'risk_hits', 'risk_density', 'lite',
+)
+COMMENT_COLUMNS = (
+    'post_id', 'comment_key', 'floor', 'author', 'content', 'post_time', 'sentiment', 'risk_keywords', 'risk_hit_count',
+)
+JSON_COLUMNS = ('risk_keywords', 'risk_hits')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS posts (
+    post_id INTEGER PRIMARY KEY,
+    fid INTEGER,
+    title TEXT,
+    url TEXT,
+    author TEXT,
+    content TEXT,
+    reply_count INTEGER,
+    post_time TEXT,
+    crawl_time TEXT,
+    sentiment REAL,
+    risk_level INTEGER,
+    risk_keywords TEXT,
+    risk_hits TEXT,
+    risk_density REAL,
+    lite INTEGER,
+    comment_count INTEGER,
+    comment_sentiment_mean REAL,
+    comment_sentiment_min REAL,
+    negative_floor_ratio REAL,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_fid ON posts (fid);
+CREATE INDEX IF NOT EXISTS idx_posts_post_time ON posts (post_time);
+CREATE INDEX IF NOT EXISTS idx_posts_crawl_time ON posts (crawl_time);
+CREATE INDEX IF NOT EXISTS idx_posts_risk_level ON posts (risk_level);
+CREATE INDEX IF NOT EXISTS idx_posts_sentiment ON posts (sentiment);
+CREATE INDEX IF NOT EXISTS idx_posts_updated ON posts (updated, post_id);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY,
+    post_id INTEGER NOT NULL,
+    comment_key TEXT,
+    floor INTEGER,
+    author TEXT,
+    content TEXT,
+    post_time TEXT,
+    sentiment REAL,
+    risk_keywords TEXT,
+    risk_hit_count INTEGER
+);
+'''
+
+# 回帖去重键所在的唯一索引（旧版库补上comment_key列后再建）
+COMMENT_INDEX = 'CREATE UNIQUE INDEX IF NOT EXISTS idx_comments_key ON comments (post_id, comment_key)'
+
+# 增量条目（只有新增楼层、没有主楼内容）和轻量条目不能覆盖已有的正文、情感值和风险信息
+UPSERT_POST = f'''
+INSERT INTO posts ({', '.join(POST_COLUMNS)}, updated) VALUES ({', '.join('?' * len(POST_COLUMNS))}, ?)
+ON CONFLICT (post_id) DO UPDATE SET
+    fid = excluded.fid,
+    title = excluded.title,
+    url = excluded.url,
+    author = COALESCE(excluded.author, posts.author),
+    content = CASE WHEN COALESCE(excluded.content, '') != '' THEN excluded.content ELSE posts.content END,
+    reply_count = excluded.reply_count,
+    post_time = COALESCE(excluded.post_time, posts.post_time),
+    crawl_time = excluded.crawl_time,
+    sentiment = COALESCE(excluded.sentiment, posts.sentiment),
+    risk_keywords = CASE WHEN excluded.risk_level >= COALESCE(posts.risk_level, 0)
+        THEN excluded.risk_keywords ELSE posts.risk_keywords END,
+    risk_hits = CASE WHEN excluded.risk_level >= COALESCE(posts.risk_level, 0)
+        THEN excluded.risk_hits ELSE posts.risk_hits END,
+    risk_level = MAX(COALESCE(excluded.risk_level, 0), COALESCE(posts.risk_level, 0)),
+    lite = MIN(excluded.lite, COALESCE(posts.lite, 1)),
+    updated = excluded.updated
+'''
+
+UPSERT_COMMENT = f'''
+INSERT INTO comments ({', '.join(COMMENT_COLUMNS)}) VALUES ({', '.join('?' * len(COMMENT_COLUMNS))})
+ON CONFLICT (post_id, comment_key) DO UPDATE SET
+    floor = excluded.floor,
+    author = excluded.author,
+    content = excluded.content,
+    post_time = excluded.post_time,
+    sentiment = COALESCE(excluded.sentiment, comments.sentiment),
+    risk_keywords = excluded.risk_keywords,
+    risk_hit_count = excluded.risk_hit_count
+'''
+
+# 每楼关键词命中次数，旧版库中没有记录次数的楼层按命中的关键词数计
+COMMENT_HITS = 'COALESCE(risk_hit_count, json_array_length(risk_keywords), 0)'
+
+# 回帖汇总按库中该帖的全部楼层重新计算（增量条目只带新增楼层）
+UPDATE_AGGREGATES = f'''
+UPDATE posts SET
+    comment_count = (SELECT COUNT(*) FROM comments WHERE comments.post_id = posts.post_id),
+    risk_density = (SELECT SUM({COMMENT_HITS}) * 1.0 / COUNT(*) FROM comments WHERE comments.post_id = posts.post_id),
+    comment_sentiment_mean = (SELECT AVG(sentiment) FROM comments WHERE comments.post_id = posts.post_id),
+    comment_sentiment_min = (SELECT MIN(sentiment) FROM comments WHERE comments.post_id = posts.post_id),
+    negative_floor_ratio = (SELECT AVG(sentiment < ?) FROM comments
+        WHERE comments.post_id = posts.post_id AND sentiment IS NOT NULL)
+WHERE post_id = ?
+'''
+
+
+def floor_value(floor):
+    floor = str(floor if floor is not None else '').strip().lstrip('#')
+    return int(floor) if floor.isdigit() else None
+
+
+def comment_key(floor, author, post_time, content):
+    """回帖在帖子内的去重键：有楼层号时用楼层号，否则用作者、发帖时间和内容的哈希，每次抓取都相同"""
+    if floor is not None:
+        return f'#{floor}'
+    text = '\0'.join(str(value or '') for value in (author, post_time, content))
+    return 'h:' + hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class PostStore:
+    """帖子和回帖的SQLite存储（WAL模式），爬虫写入的同时GUI和导出脚本可以直接查询
+
+    帖子按post_id、回帖按(post_id, comment_key)去重更新，无法解析楼层号的回帖按作者、时间和内容去重。
+    """
+
+    def __init__(self, path, negative_threshold=0.3):
+        self.path = path
+        self.negative_threshold = negative_threshold
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.migrate()
+        self.conn.execute(COMMENT_INDEX)
+        self.conn.commit()
+
+    def migrate(self):
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(comments)')]
+        # 先补risk_hit_count列，去重后重新计算汇总时会用到
+        if 'risk_hit_count' not in columns:
+            self.migrate_risk_density()
+        if 'comment_key' not in columns:
+            self.migrate_comment_key()
+
+    def migrate_comment_key(self):
+        """旧版库按(post_id, floor)去重，楼层号为空的回帖每次抓取都会重复插入：补上comment_key并删除重复行"""
+        with self.conn:
+            self.conn.execute('ALTER TABLE comments ADD COLUMN comment_key TEXT')
+            rows = self.conn.execute('SELECT id, floor, author, post_time, content FROM comments').fetchall()
+            self.conn.executemany(
+                'UPDATE comments SET comment_key = ? WHERE id = ?',
+                [(comment_key(floor, author, post_time, content), id_) for id_, floor, author, post_time, content in rows]
+            )
+            # 重复的回帖保留最后写入的一行，重新计算这些帖子的回帖汇总（更新updated，增量导出会带上）
+            post_ids = [row[0] for row in self.conn.execute(
+                'SELECT DISTINCT post_id FROM comments GROUP BY post_id, comment_key HAVING COUNT(*) > 1'
+            )]
+            self.conn.execute(
+                'DELETE FROM comments WHERE id NOT IN (SELECT MAX(id) FROM comments GROUP BY post_id, comment_key)'
+            )
+            self.conn.executemany(UPDATE_AGGREGATES, [(self.negative_threshold, post_id) for post_id in post_ids])
+            self.conn.executemany('UPDATE posts SET updated = ? WHERE post_id = ?',
+                                  [(time.time(), post_id) for post_id in post_ids])
+
+    def migrate_risk_density(self):
+        """旧版库的risk_density只按最后一批新增楼层计算：补上每楼命中次数列，按全部楼层重新计算"""
+        with self.conn:
+            self.conn.execute('ALTER TABLE comments ADD COLUMN risk_hit_count INTEGER')
+            before = dict(self.conn.execute('SELECT post_id, risk_density FROM posts'))
+            self.conn.execute(
+                f'UPDATE posts SET risk_density = (SELECT SUM({COMMENT_HITS}) * 1.0 / COUNT(*) FROM comments '
+                f'WHERE comments.post_id = posts.post_id)'
+            )
+            # 数值有变化的帖子更新updated，增量导出会带上
+            changed = [post_id for post_id, density in self.conn.execute('SELECT post_id, risk_density FROM posts')
+                       if density != before.get(post_id)]
+            self.conn.executemany('UPDATE posts SET updated = ? WHERE post_id = ?',
+                                  [(time.time(), post_id) for post_id in changed])
+
+    def close(self):
+        self.conn.close()
+
+    def write(self, items):
+        """一个事务写入一批条目"""
+        posts = []
+        comments = []
+        for item in items:
+            row = [item.get(column) for column in POST_COLUMNS]
+            for column in JSON_COLUMNS:
+                index = POST_COLUMNS.index(column)
+                row[index] = json.dumps(row[index], ensure_ascii=False) if row[index] is not None else None
+            row[POST_COLUMNS.index('lite')] = 1 if item.get('lite') else 0
+            posts.append(row)
+            for comment in item.get('comments') or []:
+                floor = floor_value(comment.get('floor'))
+                comments.append((
+                    item['post_id'],
+                    comment_key(floor, comment.get('author'), comment.get('post_time'), comment.get('content')),
+                    floor, comment.get('author'), comment.get('content'), comment.get('post_time'), comment.get('sentiment'),
+                    json.dumps(comment.get('risk_keywords') or [], ensure_ascii=False),
+                    comment.get('risk_hit_count'),
+                ))
+        with self.conn:
+            # 先取得写锁再取时间戳，保证后提交的事务updated更大，增量导出按updated记录进度不会漏掉数据
+            self.conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            self.conn.executemany(UPSERT_POST, [row + [now] for row in posts])
+            self.conn.executemany(UPSERT_COMMENT, comments)
+            self.conn.executemany(
+                UPDATE_AGGREGATES,
+                [(self.negative_threshold, post_id) for post_id in {item['post_id'] for item in items}]
+            )
+
+    def load_posts(self, limit=None, fid=None, min_risk=None, since=None, with_comments=True):
+        """按抓取时间倒序返回帖子（与爬虫输出的条目格式相同），条件均走索引"""
+        where, params = [], []
+        if fid is not None:
+            where.append('fid = ?')
+            params.append(fid)
+        if min_risk is not None:
+            where.append('risk_level >= ?')
+            params.append(min_risk)
+        if since is not None:
+            where.append('crawl_time >= ?')
+            params.append(since)
+        sql = 'SELECT * FROM posts'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY crawl_time DESC'
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+        posts = self.decode_posts(self.conn.execute(sql, params))
+        for post in posts:
+            post.pop('updated', None)
+        if with_comments and posts:
+            self.attach_comments(posts)
+        return posts
+
+    def iter_updated(self, after=None, batch_size=1000):
+        """按(updated, post_id)顺序分批返回排在after之后的帖子（带全部回帖和updated字段），用于增量导出
+
+        after为上次导出的最后一行的(updated, post_id)，None时从头开始。
+        """
+        last = (-1.0, -1) if after is None else tuple(after)
+        while True:
+            posts = self.decode_posts(self.conn.execute(
+                'SELECT * FROM posts WHERE (updated, post_id) > (?, ?) ORDER BY updated, post_id LIMIT ?',
+                (*last, batch_size)
+            ))
+            if not posts:
+                return
+            self.attach_comments(posts)
+            yield posts
+            last = (posts[-1]['updated'], posts[-1]['post_id'])
+
+    @staticmethod
+    def decode_posts(cursor):
+        names = [d[0] for d in cursor.description]
+        posts = []
+        for values in cursor:
+            post = dict(zip(names, values))
+            for column in JSON_COLUMNS:
+                post[column] = json.loads(post[column]) if post[column] else ([] if column == 'risk_keywords' else {})
+            post['lite'] = bool(post['lite'])
+            posts.append(post)
+        return posts
+
+    def attach_comments(self, posts):
+        by_id = {post['post_id']: post for post in posts}
+        for post in posts:
+            post['comments'] = []
+        ids = list(by_id)
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            cursor = self.conn.execute(
+                f"SELECT post_id, floor, author, content, post_time, sentiment, risk_keywords FROM comments "
+                f"WHERE post_id IN ({','.join('?' * len(part))}) ORDER BY post_id, floor", part
+            )
+            for post_id, floor, author, content, post_time, sentiment, risk_keywords in cursor:
+                by_id[post_id]['comments'].append({
+                    'post_id': post_id, 'floor': '' if floor is None else str(floor), 'author': author,
+                    'content': content, 'post_time': post_time, 'sentiment': sentiment,
+                    'risk_keywords': json.loads(risk_keywords) if risk_keywords else [],
+                })
+
+
+def modified_time(path):
+    """数据库及其WAL文件的最近修改时间，用于判断是否有新数据；文件不存在时返回None"""
+    times = [os.path.getmtime(p) for p in (path, path + '-wal') if os.path.exists(p)]
+    return max(times) if times else None
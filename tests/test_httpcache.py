@@ -0,0 +1,55 @@
+import time
+from email.utils import formatdate
+
+import pytest
+from scrapy.http import HtmlResponse, Request
+from scrapy.spiders import Spider
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+from scrapy.utils.test import get_crawler
+
+from ngamonitor.httpcache import NgaCachePolicy, SqliteCacheStorage
+
+READ_URL = 'https://bbs.nga.cn/read.php?tid=1&page=2'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """按项目settings创建的缓存策略和SQLite存储，缓存写到临时目录"""
+    settings = get_project_settings().copy_to_dict()
+    settings.update({'HTTPCACHE_DIR': str(tmp_path), 'LOG_ENABLED': False})
+    install_reactor(settings['TWISTED_REACTOR'])
+    crawler = get_crawler(Spider, settings)
+    spider = Spider.from_crawler(crawler, 'nga_monitor')
+    storage = SqliteCacheStorage(crawler.settings)
+    storage.open_spider(spider)
+    yield NgaCachePolicy(crawler.settings), storage, spider
+    storage.close_spider(spider)
+
+
+def page(url, request, **headers):
+    headers.setdefault('Date', formatdate(time.time() - 60, usegmt=True))
+    return HtmlResponse(url, body=b'<html></html>', headers=headers, request=request)
+
+
+def test_tail_page_is_not_reused_as_full_page(cache):
+    policy, storage, spider = cache
+    # 作为最后一页抓取（时长0），有校验头才会被缓存
+    tail = Request(READ_URL, meta={'httpcache_ttl': 0})
+    response = page(READ_URL, tail, **{'Last-Modified': formatdate(time.time() - 3600, usegmt=True)})
+    assert policy.should_cache_response(response, tail)
+    storage.store_response(spider, tail, response)
+
+    # 之后帖子有了新的一页，同一页作为已满的页面请求：仍按最后一页的时长判断，需要重新验证
+    full = Request(READ_URL)
+    cached = storage.retrieve_response(spider, full)
+    assert cached is not None
+    assert not policy.is_cached_response_fresh(cached, full)
+    assert b'If-Modified-Since' in full.headers
+
+    # 重新下载的已满页面按7天缓存，没有校验头也照常缓存和复用
+    response = page(READ_URL, full)
+    assert policy.should_cache_response(response, full)
+    storage.store_response(spider, full, response)
+    again = Request(READ_URL)
+    assert policy.is_cached_response_fresh(storage.retrieve_response(spider, again), again)
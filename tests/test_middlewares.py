@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from scrapy.core.downloader.middleware import DownloaderMiddlewareManager
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.http import HtmlResponse, Request
+from scrapy.spiders import Spider
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+from scrapy.utils.test import get_crawler
+
+from ngamonitor.middlewares import SessionPoolMiddleware
+
+HTTPCACHE = 'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware'
+SESSION_POOL = 'ngamonitor.middlewares.SessionPoolMiddleware'
+
+
+@pytest.fixture
+def downloader(tmp_path):
+    """只含缓存和会话池两个中间件的下载链，顺序取自项目settings，单个会话，缓存写到临时目录"""
+    settings = get_project_settings().copy_to_dict()
+    middlewares = {**settings['DOWNLOADER_MIDDLEWARES_BASE'], **settings['DOWNLOADER_MIDDLEWARES']}
+    settings.update({
+        'DOWNLOADER_MIDDLEWARES_BASE': {},
+        'DOWNLOADER_MIDDLEWARES': {HTTPCACHE: middlewares[HTTPCACHE], SESSION_POOL: middlewares[SESSION_POOL]},
+        'HTTPCACHE_DIR': str(tmp_path),
+        'NGA_SESSIONS': ['ngaPassportUid=1; ngaPassportCid=abc'],
+        'LOG_ENABLED': False,
+    })
+    install_reactor(settings['TWISTED_REACTOR'])
+    crawler = get_crawler(Spider, settings)
+    crawler.spider = Spider.from_crawler(crawler, 'nga_monitor')
+    manager = DownloaderMiddlewareManager.from_crawler(crawler)
+    manager._set_compat_spider(crawler.spider)
+    cache = next(mw for mw in manager.middlewares if isinstance(mw, HttpCacheMiddleware))
+    pool = next(mw for mw in manager.middlewares if isinstance(mw, SessionPoolMiddleware))
+    cache.storage.open_spider(crawler.spider)
+    yield manager, pool
+    cache.storage.close_spider(crawler.spider)
+
+
+def test_cached_request_does_not_consume_token(downloader):
+    manager, pool = downloader
+    bucket = pool.sessions[0].bucket
+    downloads = []
+
+    async def download(request):
+        downloads.append(request.url)
+        return HtmlResponse(request.url, body=b'<html></html>', request=request)
+
+    url = 'https://bbs.nga.cn/read.php?tid=1&page=1'
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(manager.download_async(download, Request(url)))
+    tokens = bucket.tokens
+    response = loop.run_until_complete(manager.download_async(download, Request(url)))
+
+    assert 'cached' in response.flags
+    assert downloads == [url]
+    assert bucket.tokens == tokens